@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+"""
+    Synthetic corpus benchmark
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Generates a project of synthetic documents, scaled by size and mix of
+    constructs, and measures for the ``ipynb`` and ``singleipynb`` builders
+    the translation throughput (nodes/sec), the ``astext`` serialization
+    time, the ``write_doc`` throughput (bytes/sec) and the peak memory
+    allocated while writing.  Results are printed as JSON, so runs before
+    and after an upgrade of Sphinx, docutils or nbformat can be compared.
+
+    Usage::
+
+        python benchmarks/bench_corpus.py [--docs N] [--scale N]
+            [--mix sections,lists,...] [--builder NAME] [--repeat N]
+            [-D name=value] [--output FILE]
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import zlib
+import time
+import json
+import struct
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                os.pardir)))
+
+import docutils
+import nbformat
+import sphinx
+from sphinx.application import Sphinx
+from sphinx.util.docutils import docutils_namespace
+
+BUILDERS = ('ipynb', 'singleipynb')
+
+
+def png(width, height):
+    """Return a minimal grey PNG image of the given size."""
+    def chunk(kind, data):
+        return (struct.pack('>I', len(data)) + kind + data +
+                struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+    rows = b''.join(b'\0' + b'\x80' * width for y in range(height))
+    return (b'\x89PNG\r\n\x1a\n' +
+            chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0,
+                                       0)) +
+            chunk(b'IDAT', zlib.compress(rows)) + chunk(b'IEND', b''))
+
+
+# Generators of reStructuredText, one per construct; `n` numbers the block
+# and `scale` sets its size.
+
+def gen_sections(n, scale):
+    underline = '-~^"\''
+    out = []
+    for depth in range(len(underline)):
+        title = 'Section %d.%d' % (n, depth)
+        out.append('%s\n%s\n\nText at depth %d with *emphasis*, **strong** '
+                   'and ``literal`` markup. %s\n' %
+                   (title, underline[depth] * len(title), depth,
+                    'More words. ' * scale))
+    return '\n'.join(out)
+
+
+def gen_lists(n, scale):
+    out = ['List block %d:\n' % n]
+    for i in range(scale):
+        out.append('- bullet %d with *inline* text\n\n'
+                   '  #. nested item\n'
+                   '  #. another nested item\n\n'
+                   '     - third level %d\n' % (i, i))
+    return '\n'.join(out)
+
+
+def gen_tables(n, scale):
+    out = ['.. list-table:: Table %d\n   :header-rows: 1\n\n'
+           '   * - Name\n     - Type\n     - Description\n' % n]
+    for i in range(scale * 5):
+        out.append('   * - name_%d\n     - int\n     - value %d\n' % (i, i))
+    return ''.join(out)
+
+
+def gen_code(n, scale):
+    body = '\n'.join('   x_%d = %d * 2' % (i, i) for i in range(scale))
+    return ('.. code-block:: python\n   :class: code-cell\n\n%s\n\n'
+            '.. code-block:: python\n\n%s\n' % (body, body))
+
+
+def gen_math(n, scale):
+    return ('Inline :math:`a_{%d}^2 + b^2` math.\n\n'
+            '.. math::\n\n   %s\n' %
+            (n, ' + '.join('x_{%d}' % i for i in range(scale))))
+
+
+def gen_images(n, scale):
+    return ('.. image:: img.png\n   :scale: 50\n\n'
+            '.. figure:: img.png\n   :width: 40px\n\n   Figure %d.\n' % n)
+
+
+def gen_admonitions(n, scale):
+    return ('.. note:: Note %d. %s\n\n'
+            '.. warning::\n\n   Warning %d with a paragraph.\n' %
+            (n, 'Admonition text. ' * scale, n))
+
+
+GENERATORS = {
+    'sections': gen_sections,
+    'lists': gen_lists,
+    'tables': gen_tables,
+    'code': gen_code,
+    'math': gen_math,
+    'images': gen_images,
+    'admonitions': gen_admonitions,
+}
+
+
+def make_project(srcdir, docs, scale, mix):
+    with open(os.path.join(srcdir, 'conf.py'), 'w') as f:
+        f.write("extensions = ['sphinxcontrib.nbbuilder']\n"
+                "master_doc = 'index'\n")
+    with open(os.path.join(srcdir, 'img.png'), 'wb') as f:
+        f.write(png(64, 48))
+    with open(os.path.join(srcdir, 'index.rst'), 'w') as f:
+        f.write('Corpus\n======\n\n.. toctree::\n\n')
+        for d in range(docs):
+            f.write('   doc%d\n' % d)
+    for d in range(docs):
+        with open(os.path.join(srcdir, 'doc%d.rst' % d), 'w') as f:
+            title = 'Document %d' % d
+            f.write('%s\n%s\n\n' % (title, '=' * len(title)))
+            for n in range(scale):
+                for kind in mix:
+                    f.write(GENERATORS[kind](n, scale) + '\n')
+
+
+def best_of(repeat, func):
+    best = None
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def doctrees(builder):
+    """Return the (docname, doctree) pairs the builder writes."""
+    if builder.name == 'singleipynb':
+        return [(builder.config.master_doc, builder.assemble_doctree())]
+    return [(docname, builder.env.get_and_resolve_doctree(docname, builder))
+            for docname in sorted(builder.env.found_docs)]
+
+
+def measure(builder, repeat):
+    trees = doctrees(builder)
+    translator_class = builder.writer.translator_class
+    nnodes = sum(1 for docname, doctree in trees
+                 for node in doctree.traverse())
+
+    def translate():
+        visitors = []
+        for docname, doctree in trees:
+            visitor = translator_class(doctree, builder)
+            visitor.walk(doctree)
+            visitors.append(visitor)
+        return visitors
+
+    translate_time = best_of(repeat, translate)
+    astext_time = None
+    for i in range(repeat):
+        visitors = translate()
+        t0 = time.perf_counter()
+        for visitor in visitors:
+            visitor.astext()
+        elapsed = time.perf_counter() - t0
+        astext_time = elapsed if astext_time is None \
+            else min(astext_time, elapsed)
+    del visitors
+
+    def write():
+        builder.written = {}
+        for docname, doctree in trees:
+            builder.write_doc(docname, doctree)
+
+    write_time = best_of(repeat, write)
+    nbytes = sum(record[2] for record in builder.written.values())
+
+    tracemalloc.start()
+    try:
+        write()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'documents': len(trees),
+        'nodes': nnodes,
+        'translate_seconds': translate_time,
+        'nodes_per_second': nnodes / translate_time,
+        'astext_seconds': astext_time,
+        'write_doc_seconds': write_time,
+        'bytes': nbytes,
+        'bytes_per_second': nbytes / write_time,
+        'peak_memory_bytes': peak,
+    }
+
+
+def run(tmpdir, buildername, repeat, overrides):
+    srcdir = os.path.join(tmpdir, 'src')
+    with docutils_namespace():
+        app = Sphinx(srcdir, srcdir, os.path.join(tmpdir, buildername),
+                     os.path.join(tmpdir, 'doctrees'), buildername,
+                     confoverrides=overrides, status=None, warning=None,
+                     freshenv=True)
+        app.build(force_all=True)
+        return measure(app.builder, repeat)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[4])
+    parser.add_argument('--docs', type=int, default=20,
+                        help='number of documents (default 20)')
+    parser.add_argument('--scale', type=int, default=10,
+                        help='blocks per construct and block size '
+                             '(default 10)')
+    parser.add_argument('--mix', default=','.join(sorted(GENERATORS)),
+                        help='comma separated constructs (default all): ' +
+                             ', '.join(sorted(GENERATORS)))
+    parser.add_argument('--builder', action='append', choices=BUILDERS,
+                        help='builder to measure, may be repeated '
+                             '(default both)')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('-D', dest='define', action='append', default=[],
+                        metavar='name=value',
+                        help='override a configuration value')
+    parser.add_argument('--output', help='write the JSON results to a file')
+    args = parser.parse_args(argv)
+
+    mix = [kind for kind in args.mix.split(',') if kind]
+    unknown = set(mix) - set(GENERATORS)
+    if unknown:
+        parser.error('unknown constructs: %s' % ', '.join(sorted(unknown)))
+    overrides = dict(item.split('=', 1) for item in args.define)
+
+    results = {}
+    tmpdir = tempfile.mkdtemp()
+    try:
+        os.mkdir(os.path.join(tmpdir, 'src'))
+        make_project(os.path.join(tmpdir, 'src'), args.docs, args.scale, mix)
+        for buildername in args.builder or BUILDERS:
+            results[buildername] = run(tmpdir, buildername, args.repeat,
+                                       overrides)
+    finally:
+        shutil.rmtree(tmpdir)
+
+    report = {
+        'parameters': {
+            'docs': args.docs,
+            'scale': args.scale,
+            'mix': mix,
+            'repeat': args.repeat,
+            'overrides': overrides,
+        },
+        'versions': {
+            'python': platform.python_version(),
+            'sphinx': sphinx.__version__,
+            'docutils': docutils.__version__,
+            'nbformat': nbformat.__version__,
+        },
+        'results': results,
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
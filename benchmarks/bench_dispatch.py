@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+    Translator dispatch benchmark
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Compares the throughput (nodes/sec) of ``IPynbTranslator.walk`` with
+    docutils' ``walkabout`` on a generated, text-heavy document, and
+    checks that both produce the same notebook, unsupported elements such
+    as footnotes and sidebars included.
+
+    Usage::
+
+        python benchmarks/bench_dispatch.py [--sections N] [--repeat N]
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                os.pardir)))
+
+from sphinx.application import Sphinx
+from sphinx.util.docutils import docutils_namespace
+
+from sphinxcontrib.writers.nb import IPynbTranslator
+
+SECTION = '''
+Section {n}
+-----------
+
+Some *emphasised* and **strong** text with ``literal`` words, repeated
+to make the paragraph long enough to matter. {n}
+
+- a bullet with *inline* markup
+- another bullet
+
+  #. nested enumerated item
+  #. and one more
+
+.. code-block:: python
+   :class: code-cell
+
+   print({n})
+
+.. note:: An admonition in section {n}.
+
+Some text [#f{n}]_ here.
+
+.. [#f{n}] Footnote body text.
+
+.. sidebar:: Side {n}
+
+   Sidebar body.
+'''
+
+
+def make_project(srcdir, sections):
+    with open(os.path.join(srcdir, 'conf.py'), 'w') as f:
+        f.write("extensions = ['sphinxcontrib.nbbuilder']\n"
+                "master_doc = 'index'\n")
+    with open(os.path.join(srcdir, 'index.rst'), 'w') as f:
+        f.write('Benchmark\n=========\n')
+        for n in range(sections):
+            f.write(SECTION.format(n=n))
+
+
+def translate(builder, doctree, fast):
+    visitor = IPynbTranslator(doctree, builder)
+    if fast:
+        visitor.walk(doctree)
+    else:
+        doctree.walkabout(visitor)
+    return visitor.astext()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[4])
+    parser.add_argument('--sections', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        srcdir = os.path.join(tmpdir, 'src')
+        os.mkdir(srcdir)
+        make_project(srcdir, args.sections)
+        with docutils_namespace():
+            app = Sphinx(srcdir, srcdir, os.path.join(tmpdir, 'out'),
+                         os.path.join(tmpdir, 'doctrees'), 'ipynb',
+                         status=None, warning=None, freshenv=True)
+            app.build(force_all=True)
+            builder = app.builder
+            doctree = builder.env.get_and_resolve_doctree('index', builder)
+            nnodes = sum(1 for node in doctree.traverse())
+
+            results = {}
+            for name, fast in (('walkabout', False), ('walk', True)):
+                best = None
+                for i in range(args.repeat):
+                    t0 = time.time()
+                    output = translate(builder, doctree, fast)
+                    elapsed = time.time() - t0
+                    best = elapsed if best is None else min(best, elapsed)
+                results[name] = (best, output)
+    finally:
+        shutil.rmtree(tmpdir)
+
+    print('%d nodes' % nnodes)
+    for name in ('walkabout', 'walk'):
+        best = results[name][0]
+        print('%-10s %8.1f ms %12.0f nodes/sec' %
+              (name, best * 1000, nnodes / best))
+    print('speedup    %8.2fx' % (results['walkabout'][0] / results['walk'][0]))
+    if results['walkabout'][1] != results['walk'][1]:
+        print('ERROR: outputs differ')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
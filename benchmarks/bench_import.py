@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+    Import time benchmark
+    ~~~~~~~~~~~~~~~~~~~~~
+
+    Runs ``sphinx-build`` under ``python -X importtime`` on a one page
+    project that lists ``sphinxcontrib.nbbuilder`` in its extensions, once
+    per builder, and reports the time spent importing the modules of the
+    extension and everything they import, and which heavy dependencies were
+    loaded.  With ``--budget`` it exits with status 1 when a builder other
+    than the ipynb builders goes over the budget or loads a heavy
+    dependency, so it can guard the startup cost of ``html`` and
+    ``linkcheck`` runs.
+
+    Usage::
+
+        python benchmarks/bench_import.py [--builder NAME] [--repeat N]
+            [--budget MS]
+"""
+
+from __future__ import print_function
+
+import os
+import re
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+BUILDERS = ['html', 'linkcheck', 'ipynb']
+IPYNB_BUILDERS = ('ipynb', 'singleipynb', 'ipynbarchive')
+
+HEAVY = ['nbformat', 'jupyter_client', 'PIL', 'imagesize',
+         'sphinxcontrib.builders', 'sphinxcontrib.writers']
+"""Packages that only the ipynb builders need."""
+
+EXTENSION = ['sphinxcontrib.nbbuilder', 'sphinxcontrib.builders',
+             'sphinxcontrib.writers']
+"""The modules of this extension; other sphinxcontrib packages are not."""
+
+LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$')
+
+
+def make_project(srcdir):
+    with open(os.path.join(srcdir, 'conf.py'), 'w') as f:
+        f.write("extensions = ['sphinxcontrib.nbbuilder']\n"
+                "master_doc = 'index'\n")
+    with open(os.path.join(srcdir, 'index.rst'), 'w') as f:
+        f.write('Import time\n===========\n\nNo links, nothing to load.\n')
+
+
+def parse_importtime(stderr):
+    """
+    Return the ``(name, self_us, children)`` trees of the ``-X importtime``
+    output `stderr`, which lists every module after the ones it imported.
+    """
+    pending = []
+    for line in stderr.splitlines():
+        match = LINE.match(line)
+        if not match:
+            continue
+        own, depth, name = (int(match.group(1)), len(match.group(3)) // 2,
+                            match.group(4))
+        children = []
+        while pending and pending[-1][0] > depth:
+            children.insert(0, pending.pop()[1])
+        pending.append((depth, (name, own, children)))
+    return [tree for depth, tree in pending]
+
+
+def in_packages(name, packages):
+    return any(name == package or name.startswith(package + '.')
+               for package in packages)
+
+
+def extension_imports(trees):
+    """
+    Return the modules of the extension and the modules they imported,
+    mapped to their own import time in microseconds.
+    """
+    modules = {}
+
+    def collect(tree, inside):
+        name, own, children = tree
+        inside = inside or in_packages(name, EXTENSION)
+        if inside:
+            modules[name] = own
+        for child in children:
+            collect(child, inside)
+
+    for tree in trees:
+        collect(tree, False)
+    return modules
+
+
+def run(tmpdir, buildername):
+    # on the path before Sphinx imports the sphinxcontrib namespace
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+        [ROOT] + [p for p in [os.environ.get('PYTHONPATH')] if p]))
+    outdir = os.path.join(tmpdir, 'out', buildername)
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-m', 'sphinx', '-q', '-E',
+         '-b', buildername, os.path.join(tmpdir, 'src'), outdir,
+         '-d', os.path.join(tmpdir, 'doctrees', buildername)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        universal_newlines=True, env=env, cwd=tmpdir)
+    if proc.returncode:
+        raise RuntimeError('sphinx-build -b %s failed:\n%s' % (
+            buildername, '\n'.join(line for line in proc.stderr.splitlines()
+                                   if not LINE.match(line))))
+    return extension_imports(parse_importtime(proc.stderr))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[4])
+    parser.add_argument('--builder', action='append',
+                        help='builder to measure, may be repeated '
+                             '(default: %s)' % ', '.join(BUILDERS))
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='runs per builder, the fastest counts '
+                             '(default 3)')
+    parser.add_argument('--budget', type=float,
+                        help='milliseconds of extension imports allowed for '
+                             'builders other than the ipynb ones')
+    args = parser.parse_args(argv)
+
+    results = {}
+    failures = []
+    tmpdir = tempfile.mkdtemp()
+    try:
+        os.mkdir(os.path.join(tmpdir, 'src'))
+        make_project(os.path.join(tmpdir, 'src'))
+        for buildername in args.builder or BUILDERS:
+            runs = [run(tmpdir, buildername) for _ in range(args.repeat)]
+            modules = min(runs, key=lambda modules: sum(modules.values()))
+            heavy = sorted(package for package in HEAVY
+                           if any(in_packages(name, [package])
+                                  for name in modules))
+            ms = sum(modules.values()) / 1000.0
+            results[buildername] = {
+                'import_ms': round(ms, 3),
+                'modules': len(modules),
+                'heavy': heavy,
+            }
+            if args.budget is not None and \
+                    buildername not in IPYNB_BUILDERS:
+                if ms > args.budget:
+                    failures.append('%s: %.1f ms of imports, budget %.1f ms'
+                                    % (buildername, ms, args.budget))
+                if heavy:
+                    failures.append('%s: imports %s' % (
+                        buildername, ', '.join(heavy)))
+    finally:
+        shutil.rmtree(tmpdir)
+
+    print(json.dumps(results, indent=2, sort_keys=True))
+    for failure in failures:
+        print('over budget: ' + failure, file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
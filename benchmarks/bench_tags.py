@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+    Tag rendering benchmark
+    ~~~~~~~~~~~~~~~~~~~~~~~
+
+    Measures the memoized ``starttag``/``attval``/``encode`` of
+    ``IPynbTranslator`` against the uncached rendering, on its own and when
+    translating a generated, table-heavy document.
+
+    Usage::
+
+        python benchmarks/bench_tags.py [--rows N] [--repeat N]
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import shutil
+import timeit
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                os.pardir)))
+
+from docutils import nodes
+from sphinx.application import Sphinx
+from sphinx.util.docutils import docutils_namespace
+
+from sphinxcontrib.writers import tags
+from sphinxcontrib.writers.nb import IPynbTranslator
+
+
+class UncachedTranslator(IPynbTranslator):
+    """Renders every tag from scratch and always escapes."""
+
+    def encode(self, text):
+        return str(text).translate(tags.ESCAPES)
+
+    def attval(self, text):
+        return self.encode(tags.WHITESPACE.sub(' ', text))
+
+    def starttag(self, node, tagname, suffix='\n', empty=False, **attributes):
+        attributes = tuple((name, tuple(value) if isinstance(value, list)
+                            else value) for name, value in attributes.items())
+        return tags.render_starttag(tagname, tuple(node.get('classes', ())),
+                                    attributes, suffix, bool(empty),
+                                    self.lang_attribute)
+
+
+def make_project(srcdir, rows):
+    with open(os.path.join(srcdir, 'conf.py'), 'w') as f:
+        f.write("extensions = ['sphinxcontrib.nbbuilder']\n"
+                "master_doc = 'index'\n")
+    with open(os.path.join(srcdir, 'index.rst'), 'w') as f:
+        f.write('Tables\n======\n\n.. list-table:: Reference\n'
+                '   :header-rows: 1\n\n'
+                '   * - Name\n     - Type\n     - Description\n')
+        for n in range(rows):
+            f.write('   * - name_%d\n     - int\n'
+                    '     - value number %d\n' % (n, n))
+        f.write('\nFields\n------\n\n')
+        for n in range(rows // 10):
+            f.write(':field %d: body %d\n' % (n, n))
+        f.write('\nTerms\n-----\n\n')
+        for n in range(rows // 10):
+            f.write('term %d\n   definition %d\n\n' % (n, n))
+
+
+def best_of(repeat, func):
+    best = None
+    for i in range(repeat):
+        t0 = time.time()
+        func()
+        elapsed = time.time() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[4])
+    parser.add_argument('--rows', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        srcdir = os.path.join(tmpdir, 'src')
+        os.mkdir(srcdir)
+        make_project(srcdir, args.rows)
+        with docutils_namespace():
+            app = Sphinx(srcdir, srcdir, os.path.join(tmpdir, 'out'),
+                         os.path.join(tmpdir, 'doctrees'), 'ipynb',
+                         status=None, warning=None, freshenv=True)
+            app.build(force_all=True)
+            builder = app.builder
+            doctree = builder.env.get_and_resolve_doctree('index', builder)
+
+            # micro-benchmark: one table entry start tag
+            entry = nodes.entry(classes=['field-body'])
+            for name, cls in (('uncached', UncachedTranslator),
+                              ('cached', IPynbTranslator)):
+                visitor = cls(doctree, builder)
+                number = 100000
+                elapsed = min(timeit.repeat(
+                    lambda: visitor.starttag(entry, 'td', '', valign='top'),
+                    number=number, repeat=args.repeat))
+                print('starttag %-9s %8.0f ns/call' %
+                      (name, elapsed / number * 1e9))
+            number = 100000
+            for name, func in (('uncached', UncachedTranslator.encode),
+                               ('cached', IPynbTranslator.encode)):
+                elapsed = min(timeit.repeat(
+                    lambda: func(None, 'plain cell text'),
+                    number=number, repeat=args.repeat))
+                print('encode   %-9s %8.0f ns/call' %
+                      (name, elapsed / number * 1e9))
+
+            # whole document
+            times = {}
+            for name, cls in (('uncached', UncachedTranslator),
+                              ('cached', IPynbTranslator)):
+                def translate():
+                    visitor = cls(doctree, builder)
+                    visitor.walk(doctree)
+                    visitor.astext()
+                times[name] = best_of(args.repeat, translate)
+                print('document %-9s %8.1f ms' % (name, times[name] * 1000))
+            print('speedup           %8.2fx' %
+                  (times['uncached'] / times['cached']))
+            print('tag cache: %s' % (tags.cached_starttag.cache_info(),))
+    finally:
+        shutil.rmtree(tmpdir)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
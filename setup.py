@@ -44,5 +44,11 @@ setup(
     packages=find_packages(),
     include_package_data=True,
     install_requires=requires,
+    extras_require={'execute': ['jupyter_client', 'ipykernel']},
+    entry_points={
+        'console_scripts': [
+            'sphinx-ipynb-watch = sphinxcontrib.builders.watch:main',
+        ],
+    },
     namespace_packages=['sphinxcontrib'],
 )
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+    sphinxcontrib.builders.archive
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Zip and tar archives of notebooks for the archive builder.
+
+    Members are appended in the order they are written, with fixed
+    timestamps, owners and permissions, so the same notebooks always give
+    the same archive.  An optional index member lists the path, size and
+    sha256 of every other member.
+
+    :copyright: Copyright 2016 by Ad Thiers.
+    :license: BSD, see LICENSE.txt for details.
+"""
+
+import io
+import gzip
+import json
+import lzma
+import hashlib
+import tarfile
+import zipfile
+import contextlib
+import tempfile
+
+from ..writers.formats import HashingWriter
+
+ARCHIVE_FORMATS = {
+    'zip': '.zip',
+    'tar': '.tar',
+    'tar.gz': '.tar.gz',
+    'tar.xz': '.tar.xz',
+}
+"""File name extension of each archive format."""
+
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+SPOOL_SIZE = 1 << 20
+
+
+class NotebookArchive(object):
+    """
+    Write members into a new archive file `filename` of format `fmt`, one
+    of `ARCHIVE_FORMATS`.  `level` is the compression level for zip and
+    compressed tar archives, `index` the name of the index member, if any.
+    """
+
+    def __init__(self, filename, fmt, level=None, index=None):
+        self.index = index
+        self.members = []
+        self.raw = open(filename, 'wb')
+        self.compressed = None
+        if fmt == 'zip':
+            self.zip = zipfile.ZipFile(self.raw, 'w', zipfile.ZIP_DEFLATED,
+                                       compresslevel=level)
+            self.level = level
+            self.tar = None
+            return
+        self.zip = None
+        if fmt == 'tar.gz':
+            self.compressed = gzip.GzipFile(
+                filename='', mode='wb', fileobj=self.raw, mtime=0,
+                compresslevel=9 if level is None else level)
+        elif fmt == 'tar.xz':
+            self.compressed = lzma.LZMAFile(self.raw, 'wb', preset=level)
+        self.tar = tarfile.open(fileobj=self.compressed or self.raw,
+                                mode='w', format=tarfile.PAX_FORMAT)
+
+    def _zipinfo(self, name):
+        info = zipfile.ZipInfo(name, ZIP_DATE_TIME)
+        info.compress_type = zipfile.ZIP_DEFLATED
+        info.create_system = 3
+        info.external_attr = 0o644 << 16
+        return info
+
+    def _tarinfo(self, name, size):
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mode = 0o644
+        info.mtime = 0
+        info.uid = info.gid = 0
+        info.uname = info.gname = ''
+        return info
+
+    def add(self, name, data):
+        """Add the bytes `data` as member `name`; return their sha256."""
+        digest = hashlib.sha256(data).hexdigest()
+        if self.zip is not None:
+            self.zip.writestr(self._zipinfo(name), data,
+                              compresslevel=self.level)
+        else:
+            self.tar.addfile(self._tarinfo(name, len(data)), io.BytesIO(data))
+        self.members.append((name, len(data), digest))
+        return digest
+
+    @contextlib.contextmanager
+    def member(self, name):
+        """
+        Context manager giving a binary file to write member `name` to,
+        with the digest and size of what was written.  Zip members are
+        streamed at the default compression level; ``ZipFile.open`` takes
+        no level, so at another level they are spooled like tar members,
+        which need their size first.
+        """
+        if self.zip is not None and self.level is None:
+            with self.zip.open(self._zipinfo(name), 'w') as f:
+                out = HashingWriter(f)
+                yield out
+        elif self.zip is not None:
+            with tempfile.SpooledTemporaryFile(SPOOL_SIZE) as f:
+                out = HashingWriter(f)
+                yield out
+                f.seek(0)
+                self.zip.writestr(self._zipinfo(name), f.read(),
+                                  compresslevel=self.level)
+        else:
+            with tempfile.SpooledTemporaryFile(SPOOL_SIZE) as f:
+                out = HashingWriter(f)
+                yield out
+                f.seek(0)
+                self.tar.addfile(self._tarinfo(name, out.size), f)
+        self.members.append((name, out.size, out.hexdigest()))
+
+    def close(self):
+        """Write the index member, if any, and finish the archive."""
+        if self.index:
+            files = [{'path': name, 'size': size, 'sha256': digest}
+                     for name, size, digest in self.members]
+            data = json.dumps({'files': files}, indent=1, sort_keys=True)
+            self.add(self.index, data.encode('utf-8'))
+        if self.zip is not None:
+            self.zip.close()
+        else:
+            self.tar.close()
+        if self.compressed is not None:
+            self.compressed.close()
+        self.raw.close()
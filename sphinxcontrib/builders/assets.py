@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+    sphinxcontrib.builders.assets
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Image embedding for the Jupyter Notebook builders.
+
+    Small images become cell attachments of the notebook that references
+    them.  Larger images are copied once into a content-addressed asset
+    directory, named by the sha256 of their contents, so an image used by
+    many notebooks is stored only once.  The digests of the large images
+    are kept across builds by stat signature, so an unchanged image is not
+    read again, and a file already in the asset directory is not copied
+    again.  Asset files no longer referenced are removed.
+
+    :copyright: Copyright 2016 by Ad Thiers.
+    :license: BSD, see LICENSE.txt for details.
+"""
+
+import os
+import re
+import json
+import base64
+import hashlib
+import mimetypes
+import posixpath
+from io import StringIO
+from os import path
+
+from sphinx.util.osutil import ensuredir
+
+from .manifest import file_digest, stat_signature
+
+CACHE_VERSION = 1
+
+# multiple of 3, so the base64 of the chunks can be concatenated
+CHUNK_SIZE = 3 << 15
+
+# images that a mimebundle stores as text rather than base64
+TEXT_MIMETYPES = ('image/svg+xml',)
+
+# the names copy_file gives to asset files
+ASSET_NAME = re.compile(r'^[0-9a-f]{64}(\.[^.]*)?$')
+
+
+def encode_file(filename):
+    """Return the sha256 digest and the base64 encoding of a file."""
+    digest = hashlib.sha256()
+    encoded = StringIO()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+            encoded.write(base64.b64encode(chunk).decode('ascii'))
+    return digest.hexdigest(), encoded.getvalue()
+
+
+def copy_file(filename, target):
+    """Copy a file to `target` through a temporary file."""
+    dirname = path.dirname(target)
+    ensuredir(dirname)
+    tmpname = path.join(dirname, '.%d.tmp' % os.getpid())
+    try:
+        with open(filename, 'rb') as src, open(tmpname, 'wb') as dst:
+            for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+                dst.write(chunk)
+        os.replace(tmpname, target)
+    except (IOError, OSError):
+        try:
+            os.remove(tmpname)
+        except OSError:
+            pass
+        raise
+
+
+class ImageAssets(object):
+    """
+    Decide how each image is included in the notebooks: as an attachment
+    when it is at most `max_size` bytes, or as a file in `assetdir`
+    (relative to the output directory) otherwise.  Results are kept per
+    image for the rest of the build.  `cache_filename` keeps the digests of
+    the large images between builds.  Unless `copy` is true the asset files
+    are not written; `sources` maps each asset name to the image file to
+    read it from.
+    """
+
+    def __init__(self, srcdir, outdir, assetdir, max_size, cache_filename,
+                 copy=True):
+        self.srcdir = srcdir
+        self.outdir = outdir
+        self.assetdir = assetdir
+        self.max_size = max_size
+        self.copy = copy
+        self.resolved = {}
+        self.sources = {}
+        self.cache_filename = cache_filename
+        self.digests = {}
+        self.dirty = False
+        try:
+            with open(cache_filename, 'r') as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            return
+        if data.get('version') == CACHE_VERSION:
+            self.digests = data.get('digests', {})
+
+    def save(self):
+        tmpname = self.cache_filename + '.tmp'
+        with open(tmpname, 'w') as f:
+            json.dump({'version': CACHE_VERSION, 'digests': self.digests}, f,
+                      sort_keys=True)
+        os.replace(tmpname, self.cache_filename)
+        self.dirty = False
+
+    def digest(self, imagepath, filename, st):
+        """Return the sha256 of an image, hashing it only if it changed."""
+        signature = stat_signature(st)
+        entry = self.digests.get(imagepath)
+        if entry is not None and entry[0] == signature:
+            return entry[1]
+        digest = file_digest(filename)
+        self.digests[imagepath] = [signature, digest]
+        self.dirty = True
+        return digest
+
+    def prefetch(self, imagepaths):
+        """
+        Resolve the images of `imagepaths` that become asset files, so
+        they are hashed and copied once, before the documents are written
+        (and before any worker process is forked).  Forget the digests of
+        images not in `imagepaths`.
+        """
+        for imagepath in set(self.digests) - set(imagepaths):
+            del self.digests[imagepath]
+            self.dirty = True
+        for imagepath in sorted(imagepaths):
+            try:
+                st = os.stat(path.join(self.srcdir, imagepath))
+            except OSError:
+                continue
+            if st.st_size > self.max_size:
+                self.resolve(imagepath)
+
+    def prune(self):
+        """
+        Remove the asset files that no image resolved in this build refers
+        to.  Call it only after all images of the project were resolved.
+        """
+        if not self.copy:
+            return
+        keep = set(result[1] for result in self.resolved.values()
+                   if result and result[0] == 'file')
+        dirname = path.join(self.outdir, self.assetdir)
+        try:
+            names = os.listdir(dirname)
+        except OSError:
+            return
+        for name in names:
+            if ASSET_NAME.match(name) and \
+                    posixpath.join(self.assetdir, name) not in keep:
+                try:
+                    os.remove(path.join(dirname, name))
+                except OSError:
+                    pass
+
+    def resolve(self, imagepath):
+        """
+        Return ``('attachment', name, mimebundle)`` or ``('file',
+        assetname)`` for the image at `imagepath` (relative to the source
+        directory), or None if it cannot be read.  `assetname` is relative
+        to the output directory.
+        """
+        try:
+            return self.resolved[imagepath]
+        except KeyError:
+            pass
+        filename = path.join(self.srcdir, imagepath)
+        ext = path.splitext(imagepath)[1].lower()
+        mimetype = mimetypes.guess_type(imagepath)[0] or \
+            'application/octet-stream'
+        try:
+            if os.stat(filename).st_size <= self.max_size:
+                if mimetype in TEXT_MIMETYPES:
+                    with open(filename, 'rb') as f:
+                        data = f.read()
+                    digest = hashlib.sha256(data).hexdigest()
+                    encoded = data.decode('utf-8')
+                else:
+                    digest, encoded = encode_file(filename)
+                result = ('attachment', digest[:16] + ext,
+                          {mimetype: encoded})
+            else:
+                name = self.digest(imagepath, filename,
+                                   os.stat(filename)) + ext
+                assetname = posixpath.join(self.assetdir, name)
+                self.sources[assetname] = filename
+                target = path.join(self.outdir, self.assetdir, name)
+                if self.copy and not path.exists(target):
+                    copy_file(filename, target)
+                result = ('file', assetname)
+        except (IOError, OSError, UnicodeDecodeError):
+            result = None
+        self.resolved[imagepath] = result
+        return result
@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+"""
+    sphinxcontrib.builders.execution
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Execution of the code cells of the notebooks, with a cache of outputs.
+
+    The outputs of a code cell depend on its source and on everything the
+    kernel ran before it, so each code cell gets a key that hashes the
+    kernel spec, the key of the code cell before it and its own source.
+    Outputs are stored in a content-addressed directory under that key.
+    A notebook whose code cells all have cached outputs is filled in from
+    the cache without starting a kernel; otherwise it runs, up to its last
+    uncached cell, on a fresh kernel taken from a pool of local kernels.
+    Several notebooks execute at the same time, one per kernel.
+
+    Kernels are started by ``jupyter_client`` on this machine, so with a
+    local ``ipykernel`` no network access is needed.
+
+    :copyright: Copyright 2016 by Ad Thiers.
+    :license: BSD, see LICENSE.txt for details.
+"""
+
+import os
+import json
+import queue
+import hashlib
+import threading
+import collections
+import subprocess
+import multiprocessing.util
+from os import path
+from concurrent.futures import ThreadPoolExecutor
+
+import nbformat
+
+# set by import_jupyter_client
+KernelSpecManager = NoSuchKernel = start_new_kernel = None
+
+CACHE_VERSION = 1
+
+
+class CellExecutionError(Exception):
+    """A code cell raised an error or did not finish in time."""
+
+
+def import_jupyter_client():
+    """
+    Import ``jupyter_client``, which is slow to import, on first use;
+    return whether it is installed.
+    """
+    global KernelSpecManager, NoSuchKernel, start_new_kernel
+    if KernelSpecManager is None:
+        try:
+            from jupyter_client.kernelspec import (KernelSpecManager,
+                                                   NoSuchKernel)
+            from jupyter_client.manager import start_new_kernel
+        except ImportError:
+            return False
+    return True
+
+
+def kernel_fingerprint(kernel_name):
+    """
+    Return a digest of the local kernel spec `kernel_name`, its command
+    line included, so a different interpreter gives different keys.
+    Raise ValueError if there is no such kernel.
+    """
+    try:
+        spec = KernelSpecManager().get_kernel_spec(kernel_name)
+    except NoSuchKernel:
+        raise ValueError('No Jupyter kernel "%s"' % kernel_name)
+    data = json.dumps([CACHE_VERSION, kernel_name, spec.to_dict()],
+                      sort_keys=True)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def cell_keys(fingerprint, cells):
+    """Return the chained cache key of each code cell of `cells`."""
+    keys = []
+    key = fingerprint
+    for cell in cells:
+        data = '%s\0%s' % (key, cell['source'])
+        key = hashlib.sha256(data.encode('utf-8')).hexdigest()
+        keys.append(key)
+    return keys
+
+
+class OutputCache(object):
+    """
+    Outputs and execution counts of code cells, one JSON file per key in
+    `dirname`.  Files are never changed once written, so processes and
+    threads can share the directory.
+    """
+
+    def __init__(self, dirname):
+        self.dirname = dirname
+
+    def filename(self, key):
+        return path.join(self.dirname, key[:2], key + '.json')
+
+    def get(self, key):
+        """Return ``(execution_count, outputs)`` for `key`, or None."""
+        try:
+            with open(self.filename(key), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        return data['execution_count'], nbformat.from_dict(data['outputs'])
+
+    def put(self, key, execution_count, outputs):
+        filename = self.filename(key)
+        tmpname = '%s.%d.%d.tmp' % (filename, os.getpid(),
+                                    threading.get_ident())
+        try:
+            os.makedirs(path.dirname(filename), exist_ok=True)
+            with open(tmpname, 'w', encoding='utf-8') as f:
+                json.dump({'execution_count': execution_count,
+                           'outputs': outputs}, f, sort_keys=True)
+            os.replace(tmpname, filename)
+        except (IOError, OSError):
+            # a missing entry only costs an execution next time
+            pass
+
+
+class Kernel(object):
+    """A local kernel and a blocking client connected to it."""
+
+    def __init__(self, kernel_name, cwd):
+        self.manager, self.client = start_new_kernel(
+            kernel_name=kernel_name, cwd=cwd, stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL)
+
+    def run(self, source, timeout):
+        """
+        Run `source` and return its ``(status, execution_count, outputs)``.
+        Output streams of the same name are joined, like nbconvert does.
+        """
+        outputs = []
+
+        def output_hook(msg):
+            msg_type = msg['header']['msg_type']
+            if msg_type == 'clear_output':
+                del outputs[:]
+            elif msg_type in ('stream', 'display_data', 'execute_result',
+                              'error'):
+                output = nbformat.v4.output_from_msg(msg)
+                if msg_type == 'stream' and outputs and \
+                        outputs[-1]['output_type'] == 'stream' and \
+                        outputs[-1]['name'] == output['name']:
+                    outputs[-1]['text'] += output['text']
+                else:
+                    outputs.append(output)
+
+        try:
+            reply = self.client.execute_interactive(
+                source, store_history=True, allow_stdin=False,
+                output_hook=output_hook, timeout=timeout)
+        except TimeoutError:
+            self.manager.interrupt_kernel()
+            raise CellExecutionError('cell did not finish within %s seconds'
+                                     % timeout)
+        content = reply['content']
+        return content['status'], content.get('execution_count'), outputs
+
+    def restart(self):
+        self.manager.restart_kernel(now=True)
+        self.client.wait_for_ready(timeout=60)
+
+    def shutdown(self):
+        self.client.stop_channels()
+        self.manager.shutdown_kernel(now=True)
+
+
+class KernelPool(object):
+    """Up to `size` kernels of `kernel_name`, started when first needed."""
+
+    def __init__(self, kernel_name, size, cwd):
+        self.kernel_name = kernel_name
+        self.size = max(1, size)
+        self.cwd = cwd
+        self.idle = queue.Queue()
+        self.kernels = []
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            start = len(self.kernels) < self.size
+            if start:
+                self.kernels.append(None)
+        if not start:
+            return self.idle.get()
+        try:
+            kernel = Kernel(self.kernel_name, self.cwd)
+        except BaseException:
+            with self.lock:
+                self.kernels.remove(None)
+            raise
+        with self.lock:
+            self.kernels[self.kernels.index(None)] = kernel
+        return kernel
+
+    def release(self, kernel):
+        """Give `kernel` back, restarted for a fresh state."""
+        try:
+            kernel.restart()
+        except Exception:
+            with self.lock:
+                self.kernels.remove(kernel)
+            kernel.shutdown()
+            return
+        self.idle.put(kernel)
+
+    def shutdown(self):
+        with self.lock:
+            kernels, self.kernels = self.kernels, []
+        for kernel in kernels:
+            if kernel is not None:
+                try:
+                    kernel.shutdown()
+                except Exception:
+                    pass
+
+
+class ExecutionStage(object):
+    """
+    Execute notebooks in the background, from as many threads as there
+    are kernels.  A stage belongs to the process that created it (`pid`);
+    its kernels are shut down at the latest when that process exits.
+    """
+
+    def __init__(self, cache, fingerprint, kernel_name, kernels, timeout,
+                 allow_errors, cwd):
+        self.cache = cache
+        self.fingerprint = fingerprint
+        self.timeout = timeout
+        self.allow_errors = allow_errors
+        self.pool = KernelPool(kernel_name, kernels, cwd)
+        self.executor = ThreadPoolExecutor(self.pool.size,
+                                           thread_name_prefix='ipynb-exec')
+        self.pending = collections.deque()
+        self.pid = os.getpid()
+        # forked workers end without running atexit handlers
+        multiprocessing.util.Finalize(self, self.shutdown, exitpriority=10)
+
+    def submit(self, key, notebooks):
+        """
+        Queue the execution of `notebooks`, the ``(outname, notebook)``
+        pairs of the parts of one document, which run on one kernel in
+        order.  `key` comes back from
+        :meth:`completed`.
+        """
+        future = self.executor.submit(self.execute, notebooks)
+        self.pending.append((key, notebooks, future))
+
+    def completed(self, wait=False):
+        """
+        Yield ``(key, notebooks, error)`` for the executions that
+        finished, in the order they were queued, where `error` is None on
+        success.  With `wait`, wait for all of them.
+        """
+        while self.pending and (wait or self.pending[0][2].done()):
+            key, notebooks, future = self.pending.popleft()
+            try:
+                future.result()
+            except Exception as err:
+                yield key, notebooks, err
+            else:
+                yield key, notebooks, None
+
+    def execute(self, notebooks):
+        """Fill in the outputs of the code cells of `notebooks`."""
+        cells = [cell for outname, nb in notebooks for cell in nb['cells']
+                 if cell['cell_type'] == 'code']
+        keys = cell_keys(self.fingerprint, cells)
+        last_miss = -1
+        for i, (cell, key) in enumerate(zip(cells, keys)):
+            cached = self.cache.get(key)
+            if cached is None:
+                last_miss = i
+            else:
+                cell['execution_count'], cell['outputs'] = cached
+        if last_miss < 0:
+            return
+        kernel = self.pool.acquire()
+        try:
+            # the cells before the last uncached one run for their state
+            for cell, key in zip(cells[:last_miss + 1], keys):
+                status, count, outputs = kernel.run(cell['source'],
+                                                    self.timeout)
+                cell['execution_count'] = count
+                cell['outputs'] = outputs
+                if status != 'ok' and not self.allow_errors:
+                    error = [output for output in outputs
+                             if output['output_type'] == 'error']
+                    raise CellExecutionError(
+                        '%s: %s' % (error[0]['ename'], error[0]['evalue'])
+                        if error else 'cell execution failed')
+                self.cache.put(key, count, outputs)
+        finally:
+            self.pool.release(kernel)
+
+    def shutdown(self):
+        if os.getpid() != self.pid:
+            return
+        self.executor.shutdown()
+        self.pool.shutdown()
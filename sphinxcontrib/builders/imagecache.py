@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+    sphinxcontrib.builders.imagecache
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Persistent cache of image dimensions for the Jupyter Notebook builders.
+
+    ``visit_image`` needs the pixel size of every image with a ``:scale:``
+    option.  The sizes are read from the image headers only, cached by
+    path, file size and modification time across builds, and prefetched
+    for all images of the project in a thread pool before writing starts.
+
+    :copyright: Copyright 2016 by Ad Thiers.
+    :license: BSD, see LICENSE.txt for details.
+"""
+
+import os
+import json
+from os import path
+from concurrent.futures import ThreadPoolExecutor
+
+CACHE_VERSION = 1
+
+_imaging = None
+
+
+def imaging():
+    """
+    Return the ``imagesize`` and PIL ``Image`` modules, None where not
+    installed.  They are imported on first use: PIL alone takes longer to
+    import than most builds spend probing images.
+    """
+    global _imaging
+    if _imaging is None:
+        try:   # reads the size from the header only
+            import imagesize
+        except ImportError:
+            imagesize = None
+        try:   # check for the Python Imaging Library
+            import PIL.Image as Image
+        except ImportError:
+            try:   # sometimes PIL modules are put in PYTHONPATH's root
+                import Image
+            except ImportError:
+                Image = None
+        _imaging = imagesize, Image
+    return _imaging
+
+
+def probe_size(filename):
+    """Return the (width, height) of an image file, or None."""
+    imagesize, Image = imaging()
+    if imagesize is not None:
+        try:
+            width, height = imagesize.get(filename)
+        except Exception:
+            width = height = -1
+        if width > 0 and height > 0:
+            return width, height
+    if Image is not None:
+        # Image.open only parses the header until the data is accessed
+        try:
+            img = Image.open(filename)
+        except Exception:
+            return None
+        try:
+            return img.size
+        finally:
+            img.close()
+    return None
+
+
+class ImageSizeCache(object):
+    """
+    Image sizes by path relative to `srcdir`, each stored together with
+    the modification time and size of the file it was read from.  The
+    entries stored since the last call of `probed` are kept apart, so a
+    worker process can hand them back.
+    """
+
+    def __init__(self, filename, srcdir):
+        self.filename = filename
+        self.srcdir = srcdir
+        self.entries = {}
+        self.new_entries = {}
+        self.dirty = False
+
+    @classmethod
+    def load(cls, filename, srcdir):
+        cache = cls(filename, srcdir)
+        try:
+            with open(filename, 'r') as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            return cache
+        if data.get('version') == CACHE_VERSION:
+            cache.entries = data.get('images', {})
+        return cache
+
+    def save(self):
+        tmpname = self.filename + '.tmp'
+        with open(tmpname, 'w') as f:
+            json.dump({'version': CACHE_VERSION, 'images': self.entries}, f,
+                      sort_keys=True)
+        os.replace(tmpname, self.filename)
+        self.dirty = False
+
+    def _signature(self, imagepath):
+        try:
+            st = os.stat(path.join(self.srcdir, imagepath))
+        except EnvironmentError:
+            return None
+        return [st.st_mtime_ns, st.st_size]
+
+    def _is_fresh(self, imagepath, signature):
+        entry = self.entries.get(imagepath)
+        return entry is not None and entry[:2] == signature
+
+    def _store(self, imagepath, signature, size):
+        entry = signature + (list(size) if size else [None, None])
+        self.entries[imagepath] = self.new_entries[imagepath] = entry
+        self.dirty = True
+
+    def probed(self):
+        """Return and forget the entries stored since the last call."""
+        entries, self.new_entries = self.new_entries, {}
+        return entries
+
+    def merge(self, entries):
+        """Add the `entries` a worker process probed."""
+        if entries:
+            self.entries.update(entries)
+            self.dirty = True
+
+    def get(self, imagepath):
+        """Return the (width, height) of `imagepath`, or None."""
+        signature = self._signature(imagepath)
+        if signature is None:
+            return None
+        if not self._is_fresh(imagepath, signature):
+            size = probe_size(path.join(self.srcdir, imagepath))
+            self._store(imagepath, signature, size)
+        width, height = self.entries[imagepath][2:]
+        if width is None:
+            return None
+        return width, height
+
+    def prefetch(self, imagepaths, nthreads=None):
+        """Read the sizes of all stale or unknown `imagepaths` in parallel."""
+        def probe(imagepath):
+            signature = self._signature(imagepath)
+            if signature is None or self._is_fresh(imagepath, signature):
+                return imagepath, None, None
+            return (imagepath, signature,
+                    probe_size(path.join(self.srcdir, imagepath)))
+
+        with ThreadPoolExecutor(nthreads) as executor:
+            for imagepath, signature, size in executor.map(probe,
+                                                           imagepaths):
+                if signature is not None:
+                    self._store(imagepath, signature, size)
+
+    def prune(self, imagepaths):
+        """Forget about images that are not in `imagepaths`."""
+        for imagepath in set(self.entries) - set(imagepaths):
+            del self.entries[imagepath]
+            self.dirty = True
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+    sphinxcontrib.builders.links
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Link index for references between notebooks.
+
+    The index is built once per build from the list of documents: it maps
+    every docname to the link of its notebook (``ipynb_link_transform`` or
+    docname plus ``ipynb_link_suffix``) and back, and for every document
+    split into several notebooks each anchor to the part it is in.  Sphinx
+    asks for the link of a document for every reference it resolves, and
+    the translator looks up the part of every anchor it links to, so both
+    are dictionary lookups instead of scans of the doctrees.  When
+    documents are split the index also collects the anchors each document
+    links to, so the documents linking to an anchor that moves to another
+    part can be written again.
+
+    :copyright: Copyright 2016 by Ad Thiers.
+    :license: BSD, see LICENSE.txt for details.
+"""
+
+import re
+import posixpath
+
+from sphinx.util.osutil import relative_uri
+
+# a Markdown link to an anchor of the same notebook
+ANCHOR_LINK = re.compile(r'\]\(#([^)\s]+)\)')
+
+
+def moved_anchors(old, new):
+    """
+    Return the ``outname#anchor`` of every anchor that is in another part
+    in the `new` anchors of the split documents than in the `old` ones.
+    An anchor of a document that is not split is in part 0.
+    """
+    moved = set()
+    for outname in set(old) | set(new):
+        before, after = old.get(outname, {}), new.get(outname, {})
+        if before == after:
+            continue
+        for anchor in set(before) | set(after):
+            if before.get(anchor, 0) != after.get(anchor, 0):
+                moved.add('%s#%s' % (outname, anchor))
+    return moved
+
+
+class LinkIndex(object):
+    """
+    The links of the notebooks of `docnames`, made by the `doc_link`
+    function.  `anchors` maps the output file name, as given by the
+    `outname` function, of each split document to a dict of its anchors
+    and the number (from 0) of the part each one is in.  If `targets` is
+    a dict, `resolve` adds the ``outname#anchor`` of every link into
+    another document to the set of the document it is in.
+    """
+
+    def __init__(self, docnames, doc_link, outname, anchors, targets=None):
+        self.doc_link = doc_link
+        self.outname = outname
+        self.anchors = anchors
+        self.targets = targets
+        self.links = dict((docname, doc_link(docname))
+                          for docname in docnames)
+        self.docnames = dict((link, docname)
+                             for docname, link in self.links.items())
+
+    def link(self, docname):
+        """Return the link of the notebook of `docname`."""
+        try:
+            return self.links[docname]
+        except KeyError:
+            return self.doc_link(docname)
+
+    def part_link(self, docname, n):
+        """Return the link of part `n` (from 0) of `docname`."""
+        if n == 0:
+            return self.link(docname)
+        return self.doc_link('%s-%d' % (docname, n + 1))
+
+    def resolve(self, fromdoc, refuri):
+        """
+        Return the internal `refuri` of a reference in `fromdoc`, pointed
+        to the part its anchor is in if the target document is split.
+        """
+        if not self.anchors and self.targets is None:
+            return refuri
+        target, sep, anchor = refuri.partition('#')
+        if not anchor:
+            return refuri
+        base = self.link(fromdoc)
+        if target:
+            target = posixpath.normpath(
+                posixpath.join(posixpath.dirname(base), target))
+        else:
+            target = base
+        docname = self.docnames.get(target)
+        if docname is None:
+            return refuri
+        outname = self.outname(docname)
+        if self.targets is not None and docname != fromdoc:
+            self.targets.setdefault(fromdoc, set()).add(
+                '%s#%s' % (outname, anchor))
+        part = self.anchors.get(outname, {}).get(anchor)
+        if not part:
+            return refuri
+        return '%s#%s' % (relative_uri(base, self.part_link(docname, part)),
+                          anchor)
+
+    def relink_parts(self, docname, parts, anchors):
+        """
+        Point the links to anchors of the same notebook in the cells of the
+        (title, cells) `parts` of `docname` to the part each anchor is in.
+        """
+        links = [self.part_link(docname, n) for n in range(len(parts))]
+        for n, (title, cells) in enumerate(parts):
+            def relink(match):
+                part = anchors.get(match.group(1), n)
+                if part == n:
+                    return match.group(0)
+                return '](%s#%s)' % (relative_uri(links[n], links[part]),
+                                     match.group(1))
+            for cell in cells:
+                if cell['cell_type'] == 'markdown' and '](#' in \
+                        cell['source']:
+                    cell['source'] = ANCHOR_LINK.sub(relink, cell['source'])
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""
+    sphinxcontrib.builders.manifest
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Persistent build manifest for the Jupyter Notebook builders.
+
+    The manifest records, per document, the stat signature and digest of
+    its source and of every file it depends on, together with a
+    fingerprint of the ``ipynb_*`` values that change the output.  It also
+    keeps the digest of every notebook written, so unchanged output is not
+    rewritten.  Outdated detection first compares the cheap stat
+    signatures (collected in one bulk :func:`os.scandir` pass) and only
+    hashes a file when its signature has changed, so a no-op rebuild does
+    not read any source.
+
+    :copyright: Copyright 2016 by Ad Thiers.
+    :license: BSD, see LICENSE.txt for details.
+"""
+
+import os
+import json
+import hashlib
+from os import path
+
+MANIFEST_VERSION = 3
+CHUNK_SIZE = 1 << 16
+
+OUTPUT_CONFIG = [
+    'ipynb_file_suffix', 'ipynb_link_suffix', 'ipynb_file_transform',
+    'ipynb_link_transform', 'ipynb_indent', 'ipynb_kernel',
+    'ipynb_metadata', 'ipynb_skip_other_lang', 'ipynb_author',
+    'ipynb_minify_json', 'ipynb_compression', 'ipynb_compression_level',
+    'ipynb_stream_output', 'ipynb_stream_assembly', 'ipynb_segment_cache',
+    'ipynb_cell_min_size', 'ipynb_cell_max_size', 'ipynb_split_level',
+    'ipynb_split_bytes', 'ipynb_split_cells', 'ipynb_table_csv_rows',
+    'ipynb_execute', 'ipynb_execution_kernel',
+    'ipynb_execution_allow_errors', 'ipynb_embed_images',
+    'ipynb_embed_max_size', 'ipynb_image_dir', 'ipynb_archive_format',
+    'ipynb_archive_name', 'ipynb_archive_index',
+]
+"""The configuration values that change the notebooks written.  Threads,
+scheduling, timeouts, validation, profiling and the build manifest do
+not, so changing them does not outdate any notebook."""
+
+
+def file_digest(filename):
+    """Return the hex sha256 digest of the contents of `filename`."""
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def stat_signature(st):
+    """Return the (mtime, size) signature of a stat result."""
+    return [st.st_mtime_ns, st.st_size]
+
+
+def scan_tree(root, exclude=()):
+    """
+    Collect the stat signatures of all files below `root`.
+
+    Returns a dict mapping the '/'-separated path relative to `root` to
+    its signature.  Directories in `exclude` (absolute paths) are not
+    descended into.
+    """
+    exclude = set(path.abspath(p) for p in exclude)
+    result = {}
+    stack = [(root, '')]
+    while stack:
+        dirname, prefix = stack.pop()
+        try:
+            entries = os.scandir(dirname)
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir():
+                        if path.abspath(entry.path) not in exclude:
+                            stack.append((entry.path,
+                                          prefix + entry.name + '/'))
+                    elif entry.is_file():
+                        result[prefix + entry.name] = \
+                            stat_signature(entry.stat())
+                except OSError:
+                    pass
+    return result
+
+
+def _stable_value(value):
+    # Callables (e.g. ipynb_file_transform) have an address in their repr
+    if callable(value):
+        return '%s.%s' % (getattr(value, '__module__', ''),
+                          getattr(value, '__qualname__', repr(value)))
+    return repr(value)
+
+
+def config_fingerprint(config, names=OUTPUT_CONFIG, extra=()):
+    """
+    Return a digest of the configuration values `names`, plus the values
+    in `extra`.
+    """
+    items = [(name, getattr(config, name, None)) for name in sorted(names)]
+    blob = json.dumps([[name, value] for name, value in items] + list(extra),
+                      sort_keys=True, default=_stable_value)
+    return hashlib.sha256(blob.encode('utf-8')).hexdigest()
+
+
+class BuildManifest(object):
+    """
+    Source and dependency digests of the documents in the last build.
+
+    ``docs`` maps a docname to a dict with the keys ``source`` (the source
+    path relative to the source directory) and ``files``, which maps the
+    source and each dependency to a ``[signature, digest]`` record.  Paths
+    are relative to `srcdir`, so the source tree can be moved or copied
+    together with the output.  ``outputs`` maps each output file name,
+    relative to the output directory, to a ``[signature, digest, size]``
+    record.  ``parts`` maps the output file name of a document split into
+    several notebooks to the file names of its further parts, and
+    ``anchors`` to a dict of its anchors and the number of the part each
+    one is in.  ``links`` maps a docname to the ``outname#anchor`` of the
+    anchors in other documents it links to, recorded when documents are
+    split.
+    """
+
+    def __init__(self, filename, srcdir):
+        self.filename = filename
+        self.srcdir = srcdir
+        self.fingerprint = None
+        self.docs = {}
+        self.outputs = {}
+        self.parts = {}
+        self.anchors = {}
+        self.links = {}
+        self.dirty = False
+
+    @classmethod
+    def load(cls, filename, srcdir):
+        manifest = cls(filename, srcdir)
+        try:
+            with open(filename, 'r') as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            return manifest
+        if data.get('version') == MANIFEST_VERSION:
+            manifest.fingerprint = data.get('fingerprint')
+            manifest.docs = data.get('docs', {})
+            manifest.outputs = data.get('outputs', {})
+            manifest.parts = data.get('parts', {})
+            manifest.anchors = data.get('anchors', {})
+            manifest.links = data.get('links', {})
+        return manifest
+
+    def save(self):
+        data = {
+            'version': MANIFEST_VERSION,
+            'fingerprint': self.fingerprint,
+            'docs': self.docs,
+            'outputs': self.outputs,
+            'parts': self.parts,
+            'anchors': self.anchors,
+            'links': self.links,
+        }
+        tmpname = self.filename + '.tmp'
+        with open(tmpname, 'w') as f:
+            json.dump(data, f, sort_keys=True)
+        os.replace(tmpname, self.filename)
+        self.dirty = False
+
+    def prune(self, docnames, outnames=None):
+        """
+        Forget about documents that are not in `docnames` and, if given,
+        about output files that are not in `outnames`.
+        """
+        for docname in set(self.docs) - set(docnames):
+            del self.docs[docname]
+            self.dirty = True
+        for docname in set(self.links) - set(docnames):
+            del self.links[docname]
+            self.dirty = True
+        if outnames is not None:
+            outnames = set(outnames)
+            for outname in set(self.parts) - outnames:
+                del self.parts[outname]
+                self.anchors.pop(outname, None)
+                self.dirty = True
+            for parts in self.parts.values():
+                outnames.update(parts)
+            for outname in set(self.outputs) - outnames:
+                del self.outputs[outname]
+                self.dirty = True
+
+    def _check_file(self, filename, record, signature):
+        # Compare the stat signature first, only hash on a mismatch.
+        if signature is None:
+            return False
+        if record[0] == signature:
+            return True
+        try:
+            digest = file_digest(path.join(self.srcdir,
+                                           *filename.split('/')))
+        except (IOError, OSError):
+            return False
+        if digest != record[1]:
+            return False
+        record[0] = signature
+        self.dirty = True
+        return True
+
+    def is_current(self, docname, source, stat):
+        """
+        Return True if `docname` was built from its current source and
+        dependencies.  `source` is the source path relative to the source
+        directory and `stat` a callable returning the signature of a file
+        (given relative to the source directory) or None if it is missing.
+        """
+        entry = self.docs.get(docname)
+        if entry is None or entry['source'] != source:
+            return False
+        for filename, record in entry['files'].items():
+            if not self._check_file(filename, record, stat(filename)):
+                return False
+        return True
+
+    def record(self, docname, source, files):
+        """
+        Store the current state of `docname`, built from `source`.
+        `files` are the source and each dependency, as '/'-separated paths
+        relative to the source directory.
+        """
+        entry = {'source': source, 'files': {}}
+        for filename in files:
+            abspath = path.join(self.srcdir, *filename.split('/'))
+            try:
+                signature = stat_signature(os.stat(abspath))
+                digest = file_digest(abspath)
+            except (IOError, OSError):
+                signature = digest = None
+            entry['files'][filename] = [signature, digest]
+        self.docs[docname] = entry
+        self.dirty = True
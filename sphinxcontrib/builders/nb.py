@@ -9,21 +9,50 @@
     :license: BSD, see LICENSE for details.
 """
 
-import codecs
+import os
+import copy
+import json
+import time
+import hashlib
+import posixpath
 from os import path
 
-from six import iteritems
+from six import iteritems, string_types
 
 from docutils import nodes
 from docutils.io import StringOutput
-from sphinx import builders
+from sphinx import addnodes, builders
 
+from sphinx.util import status_iterator
 from sphinx.util.osutil import ensuredir, os_path
+from sphinx.util.parallel import ParallelTasks, make_chunks
 from sphinx.util.nodes import inline_all_toctrees
 from sphinx.util.console import bold, darkgreen
 
 
-from ..writers.nb import IPynbWriter
+from ..writers.nb import (IPynbWriter, make_cell, make_notebook,
+                          set_cell_ids)
+from ..writers import formats
+from ..writers.stream import NotebookStream
+from ..writers.profile import VisitorProfile
+from .manifest import (BuildManifest, scan_tree, config_fingerprint,
+                       stat_signature, file_digest)
+from .scheduler import WriteScheduler
+from .validation import (VALIDATION_MODES, DeferredValidation,
+                         validation_error)
+from .imagecache import ImageSizeCache
+from .assets import ImageAssets
+from .segments import SegmentCache
+from .archive import ARCHIVE_FORMATS, NotebookArchive
+from .writebehind import WriteBehind, write_file
+from . import execution
+from .links import LinkIndex, moved_anchors
+
+BUILDINFO = '.ipynbinfo'
+SEGMENTCACHE = '.ipynbsegments'
+IMAGECACHE = 'ipynb-images.json'
+ASSETCACHE = 'ipynb-assets.json'
+EXECUTIONCACHE = 'ipynb-execution'
 
 NB_METADATA = {
     'python': {
@@ -99,33 +128,167 @@ class IPynbBuilder(builders.Builder):
     out_suffix = '.ipynb'
     allow_parallel = True
 
+    profile = None
+    """`VisitorProfile` of the build when ``ipynb_profile`` is set."""
+
+    write_behind = None
+    """`WriteBehind` queue of this process, created on first use."""
+
+    execution = None
+    """`ExecutionStage` of this process when ``ipynb_execute`` is set."""
+
+    links = None
+    """`LinkIndex` of the build, made in `prepare_writing`."""
+
+    copy_assets = True
+    """Whether large embedded images are copied into the output directory."""
+
     def init(self):
-        pass
+        compression = self.config.ipynb_compression
+        if compression not in formats.COMPRESSIONS:
+            raise ValueError('ipynb_compression must be one of %s, not "%s"'
+                             % (', '.join(repr(name) for name
+                                          in formats.COMPRESSIONS),
+                                compression))
+        level = self.config.ipynb_compression_level
+        self.compression_level = None if level is None else int(level)
+        self.out_suffix = self.config.ipynb_file_suffix or \
+            formats.file_suffix(compression)
+        self.link_suffix = self.config.ipynb_link_suffix or self.out_suffix
+        self.image_sizes = ImageSizeCache.load(
+            path.join(self.doctreedir, IMAGECACHE), self.srcdir)
+        self.manifest = BuildManifest.load(path.join(self.outdir, BUILDINFO),
+                                           self.srcdir)
+        fingerprint = config_fingerprint(self.config, extra=[self.name])
+        if self.manifest.fingerprint != fingerprint:
+            # ipynb_* values are not rebuild values for Sphinx: a change
+            # of one that affects the output invalidates every notebook
+            # written before.
+            self.manifest.docs = {}
+            self.manifest.fingerprint = fingerprint
+            self.manifest.dirty = True
+        self.splitting = bool(self.config.ipynb_split_level or
+                              self.config.ipynb_split_bytes or
+                              self.config.ipynb_split_cells)
+        self.kernel_fingerprint = None
+        if self.config.ipynb_execute:
+            if not execution.import_jupyter_client():
+                self.warn('ipynb_execute needs jupyter_client and a local '
+                          'kernel such as ipykernel; notebooks are not '
+                          'executed')
+            else:
+                self.kernel_fingerprint = execution.kernel_fingerprint(
+                    self.config.ipynb_execution_kernel)
+
+    def get_outname(self, docname):
+        """Return the '/'-separated output file name relative to outdir."""
+        return docname + self.out_suffix
+
+    def get_part_outname(self, outname, n):
+        """Return the output file name of part `n` (from 0) of `outname`."""
+        if n == 0:
+            return outname
+        return '%s-%d%s' % (outname[:-len(self.out_suffix)], n + 1,
+                            self.out_suffix)
+
+    def get_outfilename(self, docname):
+        return path.join(self.outdir, os_path(self.get_outname(docname)))
+
+    def get_source_suffixes(self):
+        suffixes = self.config.source_suffix
+        if isinstance(suffixes, string_types):
+            return [suffixes]
+        return list(suffixes)
 
     def get_outdated_docs(self):
+        # One scandir pass over the source and output trees replaces the
+        # per-document doc2path()/getmtime() calls.
+        srcfiles = scan_tree(self.srcdir, exclude=(self.outdir,
+                                                   self.doctreedir))
+        outfiles = scan_tree(self.outdir)
+        suffixes = self.get_source_suffixes()
+
+        def stat(filename):
+            try:
+                return srcfiles[filename.replace(os.sep, '/')]
+            except KeyError:
+                pass
+            try:
+                st = os.stat(path.join(self.srcdir, filename))
+            except EnvironmentError:
+                return None
+            return [st.st_mtime_ns, st.st_size]
+
+        outdated = False
         for docname in self.env.found_docs:
             if docname not in self.env.all_docs:
+                outdated = True
                 yield docname
                 continue
-            targetname = self.env.doc2path(docname, self.outdir,
-                                           self.out_suffix)
-            try:
-                targetmtime = path.getmtime(targetname)
-            except Exception:
-                targetmtime = 0
-            try:
-                srcmtime = path.getmtime(self.env.doc2path(docname))
-                if srcmtime > targetmtime:
-                    yield docname
-            except EnvironmentError:
+            for suffix in suffixes:
+                source = docname + suffix
+                if source in srcfiles:
+                    break
+            else:
                 # source doesn't exist anymore
-                pass
+                continue
+            if self.get_outname(docname) not in outfiles or \
+                    not self.manifest.is_current(docname, source, stat):
+                outdated = True
+                yield docname
+
+        if self.manifest.dirty:
+            self.save_manifest()
+        if not outdated:
+            # Sphinx may stop here without calling finish(); the build
+            # manifest must not keep the statuses of the last build
+            self.build_outputs = {}
+            self.write_build_manifest()
+
+    def record_doc(self, docname):
+        """Store the source and dependency digests of `docname`."""
+        source = self.env.doc2path(docname, None)
+        files = [source.replace(os.sep, '/')]
+        for dep in self.env.dependencies.get(docname, ()):
+            files.append(dep.replace(os.sep, '/'))
+        self.manifest.record(docname, source.replace(os.sep, '/'), files)
+
+    def save_manifest(self):
+        ensuredir(self.outdir)
+        try:
+            self.manifest.save()
+        except (IOError, OSError) as err:
+            self.warn("error writing file %s: %s" %
+                      (self.manifest.filename, err))
+
+    def get_doc_link(self, docname):
+        """Return the link of the notebook of `docname` from the root."""
+        if self.config.ipynb_link_transform:
+            return self.config.ipynb_link_transform(docname)
+        return docname + self.link_suffix
 
     def get_target_uri(self, docname, typ=None):
-        return ''
+        if self.links is None:
+            return self.get_doc_link(docname)
+        return self.links.link(docname)
+
+    def resolve_uri(self, refuri):
+        """
+        Return the link for the internal reference `refuri` of the current
+        document, see `LinkIndex.resolve`.
+        """
+        return self.links.resolve(self.current_docname, refuri)
 
     def prepare_writing(self, docnames):
         self.writer = IPynbWriter(self)
+        self.written = {}
+        self.doc_parts = {}
+        self.doc_links = {}
+        # a copy: the anchors the links of this build are made with
+        self.links = LinkIndex(self.env.found_docs, self.get_doc_link,
+                               self.get_outname, dict(self.manifest.anchors),
+                               self.doc_links if self.splitting else None)
+        self.build_outputs = {}
         metadata = self.config.ipynb_metadata
 
         if metadata:
@@ -150,26 +313,561 @@ class IPynbBuilder(builders.Builder):
             self.metadata["author"] = self.config.ipynb_author
 
         self.skip_other_lang = self.config.ipynb_skip_other_lang
+        if self.config.ipynb_profile:
+            self.profile = VisitorProfile()
+        self.prefetch_images()
+        if self.config.ipynb_embed_images:
+            self.image_assets = ImageAssets(
+                self.srcdir, self.outdir, self.config.ipynb_image_dir,
+                int(self.config.ipynb_embed_max_size),
+                path.join(self.doctreedir, ASSETCACHE), self.copy_assets)
+            self.image_assets.prefetch(list(self.env.images))
+        else:
+            self.image_assets = None
+        if self.config.ipynb_validation not in VALIDATION_MODES:
+            raise ValueError('ipynb_validation must be one of %s, not "%s"' %
+                             (', '.join(VALIDATION_MODES),
+                              self.config.ipynb_validation))
+        if self.splitting:
+            self.plan_parts(docnames)
+
+    def plan_parts(self, docnames):
+        """
+        Translate the documents to be written once before any of them is
+        written, to learn the part of a split document each anchor is in:
+        a link from another document goes to the part its anchor is in in
+        this build.  The documents linking to an anchor that moved to
+        another part are added to `docnames`, the set `Builder.write`
+        writes.
+        """
+        planned = {}
+        profile, self.profile = self.profile, None
+        try:
+            for docname in sorted(docnames):
+                doctree = self.env.get_and_resolve_doctree(docname, self)
+                self.current_docname = docname
+                self.writer.write(doctree, StringOutput(encoding='utf-8'))
+                planned[self.get_outname(docname)] = \
+                    self.writer.anchors if self.writer.parts else {}
+        finally:
+            self.profile = profile
+            self.doc_links.clear()
+        anchors = self.links.anchors
+        moved = moved_anchors(anchors, planned)
+        for outname, part_anchors in planned.items():
+            if part_anchors:
+                anchors[outname] = part_anchors
+            else:
+                anchors.pop(outname, None)
+        if not moved:
+            return
+        linking = sorted(docname for docname, targets
+                         in self.manifest.links.items()
+                         if docname not in docnames and
+                         docname in self.env.found_docs and
+                         moved.intersection(targets))
+        if linking:
+            self.info('also writing %d documents linking to moved '
+                      'anchors... ' % len(linking), nonl=True)
+            docnames.update(linking)
+
+    def outdate_moved_links(self):
+        """
+        Forget the documents linking to an anchor that did not end up in
+        the part `plan_parts` found, so the next build writes them again.
+        """
+        moved = moved_anchors(self.links.anchors, self.manifest.anchors)
+        if not moved:
+            return
+        for docname, targets in self.manifest.links.items():
+            if moved.intersection(targets):
+                self.manifest.docs.pop(docname, None)
+                self.manifest.dirty = True
+
+    def prefetch_images(self):
+        """Read the sizes of all images of the project before writing."""
+        # normalized as visit_image looks them up: a document in a
+        # subdirectory may give 'sub/../image.png'
+        imagepaths = sorted(set(posixpath.normpath(imagepath)
+                                for imagepath in self.env.images))
+        self.image_sizes.prune(imagepaths)
+        if imagepaths:
+            self.image_sizes.prefetch(imagepaths)
 
     def write_doc(self, docname, doctree):
         self.current_docname = docname
         destination = StringOutput(encoding='utf-8')
         self.info(bold('writing doc... '), nonl=True)
         self.info(docname)
-        self.writer.write(doctree, destination)
-        outfilename = path.join(self.outdir, os_path(docname) + self.out_suffix)
+        outname = self.get_outname(docname)
+        if self.splitting:
+            self.doc_links[docname] = set()
+        if self.profile is not None:
+            nodes, start = self.profile.nodes, time.perf_counter()
+        if self.kernel_fingerprint is not None:
+            self.writer.write(doctree, destination)
+            self.execute_doc(outname)
+        elif self.config.ipynb_stream_output and not self.splitting:
+            self.write_stream(outname, doctree, destination)
+        elif self.splitting:
+            self.writer.write(doctree, destination)
+            if self.writer.parts:
+                self.write_parts(outname, self.writer.parts)
+            else:
+                self.write_output(outname, self.writer.output)
+                self.doc_parts[outname] = ([], {})
+        else:
+            self.writer.write(doctree, destination)
+            self.write_output(outname, self.writer.output)
+        if self.profile is not None:
+            record = self.written.get(outname)
+            self.profile.add_document(docname, self.profile.nodes - nodes,
+                                      time.perf_counter() - start,
+                                      record[2] if record else 0)
+
+    def output_unchanged(self, outname, digest):
+        """
+        Return True if the output file `outname` still holds the content
+        with `digest` that we wrote there before.
+        """
+        record = self.manifest.outputs.get(outname)
+        if not record or record[1] != digest:
+            return False
+        outfilename = path.join(self.outdir, os_path(outname))
+        try:
+            if stat_signature(os.stat(outfilename)) != record[0]:
+                return False
+        except EnvironmentError:
+            return False
+        self.written[outname] = record + ['unchanged']
+        return True
+
+    def note_output(self, outname, digest, size):
+        outfilename = path.join(self.outdir, os_path(outname))
+        signature = stat_signature(os.stat(outfilename))
+        self.written[outname] = [signature, digest, size, 'changed']
+
+    def write_output(self, outname, text):
+        """
+        Write `text` to the output file `outname`, unless the file on disk
+        is unchanged since we wrote the same content there.
+        """
+        data = formats.compress(text.encode('utf-8'),
+                                self.config.ipynb_compression,
+                                self.compression_level)
+        digest = hashlib.sha256(data).hexdigest()
+        if self.output_unchanged(outname, digest):
+            return
+        outfilename = path.join(self.outdir, os_path(outname))
+        if int(self.config.ipynb_write_threads):
+            # recorded now, the stat signature follows in collect_writes
+            self.written[outname] = [None, digest, len(data), 'changed']
+            self.get_write_behind().submit(
+                (self.current_docname, outname, digest, len(data)),
+                outfilename, data)
+            self.collect_writes()
+            return
+        try:
+            write_file(outfilename, data)
+            self.note_output(outname, digest, len(data))
+        except (IOError, OSError) as err:
+            self.warn("error writing file %s of %s: %s" %
+                      (outfilename, self.current_docname, err))
+
+    def get_write_behind(self):
+        if self.write_behind is None or \
+                self.write_behind.pid != os.getpid():
+            self.write_behind = WriteBehind(
+                int(self.config.ipynb_write_threads),
+                int(self.config.ipynb_write_queue))
+        return self.write_behind
+
+    def collect_writes(self, wait=False):
+        """
+        Record the notebooks the write-behind queue finished writing, all
+        queued ones if `wait` is true.
+        """
+        if self.write_behind is None or \
+                self.write_behind.pid != os.getpid():
+            return
+        for (docname, outname, digest, size), outfilename, err in \
+                self.write_behind.completed(wait):
+            if err is None:
+                try:
+                    self.note_output(outname, digest, size)
+                    continue
+                except (IOError, OSError) as stat_err:
+                    err = stat_err
+            self.written.pop(outname, None)
+            self.warn("error writing file %s of %s: %s" %
+                      (outfilename, docname, err))
+
+    def write_parts(self, outname, parts):
+        """
+        Write the (title, cells) `parts` of a split document as a series of
+        notebooks, the first one under `outname`.
+        """
+        for name, nb in self.part_notebooks(outname, parts):
+            self.write_output(name, formats.writes(
+                nb, self.config.ipynb_minify_json))
+
+    def part_notebooks(self, outname, parts):
+        """
+        Return the ``(outname, notebook)`` pairs of the (title, cells)
+        `parts` of a split document.  Every part ends with links to the
+        previous and next part and to the first one, which lists all parts.
+        """
+        notebooks = []
+        docname = self.current_docname
+        names = [self.get_part_outname(outname, n) for n in range(len(parts))]
+        titles = [title.replace(']', '\\]') or posixpath.basename(name)
+                  for (title, cells), name in zip(parts, names)]
+        anchors = self.writer.anchors
+        if anchors:
+            self.links.relink_parts(docname, parts, anchors)
+        # the parts are in one directory
+        links = [posixpath.basename(self.links.part_link(docname, n))
+                 for n in range(len(parts))]
+        for n, (title, cells) in enumerate(parts):
+            navigation = []
+            if n > 0:
+                navigation.append('[&larr; %s](%s)' % (titles[n - 1],
+                                                       links[n - 1]))
+                navigation.append('[&uarr; %s](%s)' % (titles[0], links[0]))
+            if n + 1 < len(parts):
+                navigation.append('[%s &rarr;](%s)' % (titles[n + 1],
+                                                       links[n + 1]))
+            source = ' | '.join(navigation) + '\n'
+            if n == 0:
+                source = ''.join('%d. [%s](%s)\n' % (i + 1, titles[i],
+                                                     links[i])
+                                 for i in range(len(parts))) + '\n' + source
+            nb = make_notebook(self.metadata)
+            nb['cells'] = cells + [make_cell('markdown', source)]
+            set_cell_ids(nb['cells'],
+                         '%s-%d' % (docname, n + 1) if n else docname)
+            if self.config.ipynb_validation == 'inline':
+                error = validation_error(nb)
+                if error:
+                    self.warn('invalid notebook %s: %s' % (names[n], error))
+            notebooks.append((names[n], nb))
+        self.doc_parts[outname] = (names[1:], anchors)
+        return notebooks
+
+    def execute_doc(self, outname):
+        """
+        Queue the notebooks the writer made of the current document for
+        execution; they are written when it is done.
+        """
+        if self.writer.parts:
+            notebooks = self.part_notebooks(outname, self.writer.parts)
+        else:
+            # a copy, the cells may be held by a cached segment as well
+            notebooks = [(outname, copy.deepcopy(self.writer.notebook))]
+            if self.splitting:
+                self.doc_parts[outname] = ([], {})
+        self.get_execution().submit(self.current_docname, notebooks)
+        self.collect_executions()
+
+    def get_execution(self):
+        if self.execution is None or self.execution.pid != os.getpid():
+            config = self.config
+            self.execution = execution.ExecutionStage(
+                execution.OutputCache(path.join(self.doctreedir,
+                                                EXECUTIONCACHE)),
+                self.kernel_fingerprint, config.ipynb_execution_kernel,
+                int(config.ipynb_execution_kernels),
+                float(config.ipynb_execution_timeout),
+                config.ipynb_execution_allow_errors, self.srcdir)
+        return self.execution
+
+    def collect_executions(self, wait=False):
+        """
+        Write the notebooks whose execution finished, all queued ones if
+        `wait` is true.  A notebook that failed is written as far as it
+        got.
+        """
+        if self.execution is None or self.execution.pid != os.getpid():
+            return
+        current_docname = self.current_docname
+        try:
+            for docname, notebooks, err in self.execution.completed(wait):
+                if err is not None:
+                    self.warn('error executing %s: %s' % (docname, err))
+                self.current_docname = docname
+                for outname, nb in notebooks:
+                    self.write_output(outname, formats.writes(
+                        nb, self.config.ipynb_minify_json))
+        finally:
+            self.current_docname = current_docname
+
+    def write_stream(self, outname, doctree, destination):
+        """
+        Translate `doctree` straight into the output file `outname`, one
+        cell at a time.  The notebook goes to a temporary file first, which
+        is dropped if it turns out identical to the current output.
+        """
+        outfilename = path.join(self.outdir, os_path(outname))
+        tmpname = outfilename + '.tmp'
         ensuredir(path.dirname(outfilename))
         try:
-            f = codecs.open(outfilename, 'w', 'utf-8')
-            try:
-                f.write(self.writer.output)
-            finally:
-                f.close()
+            with open(tmpname, 'wb') as raw:
+                out = formats.HashingWriter(raw)
+                with formats.compressor(out, self.config.ipynb_compression,
+                                        self.compression_level) as f:
+                    self.writer.stream = NotebookStream(
+                        f, self.config.ipynb_minify_json)
+                    try:
+                        self.writer.write(doctree, destination)
+                    finally:
+                        self.writer.stream = None
+            if self.output_unchanged(outname, out.hexdigest()):
+                os.remove(tmpname)
+            else:
+                os.replace(tmpname, outfilename)
+                self.note_output(outname, out.hexdigest(), out.size)
+        except (IOError, OSError) as err:
+            self.warn("error writing file %s of %s: %s" %
+                      (outfilename, self.current_docname, err))
+
+    def merge_written(self, written):
+        for outname, (signature, digest, size, status) in written.items():
+            self.manifest.outputs[outname] = [signature, digest, size]
+            self.build_outputs[outname] = status
+        self.manifest.dirty = True
+
+    def merge_parts(self, doc_parts):
+        """
+        Record the further parts and the anchors of the documents written
+        and remove the parts a document no longer has.
+        """
+        for outname, (parts, anchors) in doc_parts.items():
+            for stale in set(self.manifest.parts.get(outname, ())) - \
+                    set(parts):
+                self.manifest.outputs.pop(stale, None)
+                try:
+                    os.remove(path.join(self.outdir, os_path(stale)))
+                except OSError:
+                    pass
+            if parts:
+                self.manifest.parts[outname] = parts
+                self.manifest.anchors[outname] = anchors
+            else:
+                self.manifest.parts.pop(outname, None)
+                self.manifest.anchors.pop(outname, None)
+            self.manifest.dirty = True
+
+    def merge_links(self, doc_links):
+        """
+        Record the anchors in other documents the documents written link
+        to.
+        """
+        for docname, targets in doc_links.items():
+            if targets:
+                self.manifest.links[docname] = sorted(targets)
+            else:
+                self.manifest.links.pop(docname, None)
+            self.manifest.dirty = True
+
+    def merge_local_results(self):
+        """Merge what this process wrote since the last call."""
+        self.collect_executions(wait=True)
+        self.collect_writes(wait=True)
+        self.merge_written(self.written)
+        self.merge_parts(self.doc_parts)
+        self.merge_links(self.doc_links)
+        self.written = {}
+        self.doc_parts = {}
+        # the link index collects into this dict
+        self.doc_links.clear()
+
+    def reset_results(self):
+        """Start collecting the results of a worker process afresh."""
+        self.written = {}
+        self.doc_parts = {}
+        self.doc_links.clear()
+        self.image_sizes.probed()
+        if self.profile is not None:
+            self.profile = VisitorProfile()
+
+    def results(self, wait=True):
+        """
+        Return what a worker process has to hand back and forget it.  With
+        `wait`, wait for all queued executions and writes first; otherwise
+        return what is finished so far and keep the notebooks still being
+        executed or written for a later call.
+        """
+        self.collect_executions(wait)
+        self.collect_writes(wait)
+        # write-behind records have no stat signature until written
+        written = dict((outname, record)
+                       for outname, record in self.written.items()
+                       if record[0] is not None or wait)
+        for outname in written:
+            del self.written[outname]
+        doc_parts, self.doc_parts = self.doc_parts, {}
+        doc_links = dict(self.doc_links)
+        self.doc_links.clear()
+        profile = None
+        if self.profile is not None:
+            profile = self.profile.data()
+            self.profile = VisitorProfile()
+        return (written, doc_parts, doc_links, self.image_sizes.probed(),
+                profile)
+
+    def merge_results(self, results):
+        """Merge the `results` of a worker process."""
+        written, doc_parts, doc_links, image_sizes, profile = results
+        self.merge_written(written)
+        self.merge_parts(doc_parts)
+        self.merge_links(doc_links)
+        self.image_sizes.merge(image_sizes)
+        if profile is not None:
+            self.profile.merge(profile)
+
+    def _write_serial(self, docnames):
+        builders.Builder._write_serial(self, docnames)
+        self.merge_local_results()
+
+    def _write_parallel(self, docnames, nproc):
+        if self.config.ipynb_write_scheduler == 'size':
+            # The main process only dispatches, so it can have a worker's
+            # share of the cores back.
+            WriteScheduler(self, nproc + 1).run(docnames)
+            return
+
+        # Same as Builder._write_parallel, but the children hand back what
+        # they wrote so the output digests end up in the manifest, and
+        # their profile if any.
+        def write_process(docs):
+            self.reset_results()
+            for docname, doctree in docs:
+                self.write_doc(docname, doctree)
+            return self.results()
+
+        def on_chunk_done(args, results):
+            self.merge_results(results)
+
+        firstname, docnames = docnames[0], docnames[1:]
+        doctree = self.env.get_and_resolve_doctree(firstname, self)
+        self.write_doc_serialized(firstname, doctree)
+        self.write_doc(firstname, doctree)
+        self.merge_local_results()
+
+        tasks = ParallelTasks(nproc)
+        chunks = make_chunks(docnames, nproc)
+
+        for chunk in status_iterator(chunks, 'writing output... ', 'darkgreen',
+                                     len(chunks), self.app.verbosity):
+            arg = []
+            for docname in chunk:
+                doctree = self.env.get_and_resolve_doctree(docname, self)
+                self.write_doc_serialized(docname, doctree)
+                arg.append((docname, doctree))
+            tasks.add_task(write_process, arg, on_chunk_done)
+
+        self.info(bold('waiting for workers...'))
+        tasks.join()
+
+    def write_doc_serialized(self, docname, doctree):
+        self.record_doc(docname)
+
+    def write_build_manifest(self):
+        """
+        Write the list of all output files with their size, digest and
+        whether this build changed them, for downstream sync jobs.
+        """
+        filename = self.config.ipynb_build_manifest
+        if not filename:
+            return
+        files = []
+        for outname, (signature, digest, size) in \
+                sorted(self.manifest.outputs.items()):
+            files.append({
+                'path': outname,
+                'size': size,
+                'sha256': digest,
+                'status': self.build_outputs.get(outname, 'unchanged'),
+            })
+        outfilename = path.join(self.outdir, filename)
+        try:
+            with open(outfilename, 'w') as f:
+                json.dump({'builder': self.name, 'files': files}, f,
+                          indent=1, sort_keys=True)
         except (IOError, OSError) as err:
             self.warn("error writing file %s: %s" % (outfilename, err))
 
+    def write_profile(self):
+        """Log the handler profile and dump it as JSON."""
+        self.info(bold('translator profile:'))
+        for line in self.profile.report():
+            self.info('  ' + line)
+        outfilename = path.join(self.outdir, self.config.ipynb_profile)
+        try:
+            with open(outfilename, 'w') as f:
+                json.dump(self.profile.as_json(), f, indent=1,
+                          sort_keys=True)
+        except (IOError, OSError) as err:
+            self.warn("error writing file %s: %s" % (outfilename, err))
+
+    def start_validation(self):
+        """Start validating this build's notebooks in deferred mode."""
+        if self.config.ipynb_validation != 'deferred':
+            return None
+        filenames = [path.join(self.outdir, os_path(outname))
+                     for outname in self.build_outputs]
+        sample = self.config.ipynb_validation_sample
+        if sample is not None:
+            sample = float(sample)
+        validation = DeferredValidation(filenames, sample,
+                                        self.app.parallel or None)
+        validation.start()
+        return validation
+
+    def report_validation(self, validation):
+        self.info(bold('validating notebooks... '), nonl=True)
+        errors = validation.report()
+        self.info('%d checked, %d invalid' %
+                  (len(validation.filenames), len(errors)))
+        for filename, error in errors:
+            self.warn('invalid notebook %s: %s' % (filename, error))
+
     def finish(self):
-        pass
+        if self.execution is not None:
+            self.execution.shutdown()
+            self.execution = None
+        if self.write_behind is not None:
+            self.write_behind.shutdown()
+            self.write_behind = None
+        validation = self.start_validation()
+        if self.splitting and self.links is not None:
+            self.outdate_moved_links()
+        self.manifest.prune(self.env.found_docs,
+                            set(self.get_outname(docname)
+                                for docname in self.env.found_docs))
+        self.write_build_manifest()
+        if self.profile is not None:
+            self.write_profile()
+        if self.manifest.dirty:
+            self.save_manifest()
+        if self.image_sizes.dirty:
+            try:
+                self.image_sizes.save()
+            except (IOError, OSError) as err:
+                self.warn("error writing file %s: %s" %
+                          (self.image_sizes.filename, err))
+        assets = getattr(self, 'image_assets', None)
+        if assets is not None:
+            # every image of the project was resolved in prepare_writing
+            assets.prune()
+            if assets.dirty:
+                try:
+                    assets.save()
+                except (IOError, OSError) as err:
+                    self.warn("error writing file %s: %s" %
+                              (assets.cache_filename, err))
+        if validation is not None:
+            self.report_validation(validation)
 
 
 class SingleIPynbBuilder(IPynbBuilder):
@@ -180,19 +878,68 @@ class SingleIPynbBuilder(IPynbBuilder):
 
     name = 'singleipynb'
 
-    def fix_refuris(self, tree):
-        # fix refuris with double anchor
-        fname = self.config.master_doc + self.out_suffix
-        for refnode in tree.traverse(nodes.reference):
-            if 'refuri' not in refnode:
-                continue
-            refuri = refnode['refuri']
-            hashindex = refuri.find('#')
-            if hashindex < 0:
-                continue
-            hashindex = refuri.find('#', hashindex+1)
-            if hashindex >= 0:
-                refnode['refuri'] = fname + refuri[hashindex:]
+    def init(self):
+        IPynbBuilder.init(self)
+        # cached segments cannot be split at their sections
+        if self.config.ipynb_segment_cache and not self.splitting:
+            self.segments = SegmentCache.load(
+                path.join(self.outdir, SEGMENTCACHE),
+                config_fingerprint(self.config, extra=[self.name]))
+        else:
+            self.segments = None
+        self.doc_digests = {}
+
+    def get_outname(self, docname):
+        return self.config.master_doc + self.out_suffix
+
+    def plan_parts(self, docnames):
+        # there is one notebook; part_notebooks points its links to anchors
+        # at their parts
+        pass
+
+    def doc_digest(self, docname):
+        """
+        Return a digest of the doctree of `docname` and the stat signatures
+        of its dependencies, or None if it has no doctree.
+        """
+        try:
+            return self.doc_digests[docname]
+        except KeyError:
+            pass
+        digest = hashlib.sha256()
+        try:
+            digest.update(file_digest(self.env.doc2path(
+                docname, self.doctreedir, '.doctree')).encode('ascii'))
+        except (IOError, OSError):
+            result = None
+        else:
+            for dep in sorted(self.env.dependencies.get(docname, ())):
+                try:
+                    signature = stat_signature(
+                        os.stat(path.join(self.srcdir, dep)))
+                except (IOError, OSError):
+                    signature = None
+                digest.update(('%s %s\n' % (dep, signature)).encode('utf-8'))
+            result = digest.hexdigest()
+        self.doc_digests[docname] = result
+        return result
+
+    def get_target_uri(self, docname, typ=None):
+        if docname in self.env.all_docs:
+            # all documents are in the one notebook, each starts with an
+            # anchor
+            return '#document-' + docname
+        return self.get_doc_link(docname)
+
+    def get_relative_uri(self, from_, to, typ=None):
+        return self.get_target_uri(to, typ)
+
+    def resolve_uri(self, refuri):
+        # a reference to an anchor in another document comes with the
+        # anchor of that document first
+        if refuri.startswith('#document-'):
+            return '#' + refuri.rsplit('#', 1)[1]
+        return refuri
 
     def assemble_doctree(self):
         master = self.config.master_doc
@@ -201,11 +948,76 @@ class SingleIPynbBuilder(IPynbBuilder):
         tree = inline_all_toctrees(self, set(), master, tree, darkgreen, [master])
         tree['docname'] = master
 
-        # self.env.resolve_references(tree, master, self)
-        # self.fix_refuris(tree)
-
+        self.env.resolve_references(tree, master, self)
         return tree
 
+    def iter_included(self, toctreenode, level):
+        """
+        Yield the documents included by `toctreenode` as ``start_of_file``
+        nodes, in the order and with the section docnames that
+        ``inline_all_toctrees`` gives them.  Each doctree is loaded only
+        when the previous one has been translated, so at most one document
+        per toctree level is held in memory.
+
+        Each node comes in a ``(node, segment)`` pair.  Without the segment
+        cache `segment` is None.  Otherwise it is a list the translator
+        fills with the cells of the document, which is cached once the
+        translator asks for the next document; for an unchanged document
+        it is the cached list of cells and `node` is None.
+        """
+        for includefile in map(str, toctreenode['includefiles']):
+            if includefile in self.traversed:
+                continue
+            if self.segments is not None:
+                entry = self.cached_segment(includefile, level)
+                if entry is not None:
+                    for name, digest in entry['docs']:
+                        self.info(darkgreen(name) + " ", nonl=True)
+                        self.traversed.append(name)
+                    yield None, entry['cells']
+                    continue
+            start = len(self.traversed)
+            self.traversed.append(includefile)
+            try:
+                self.info(darkgreen(includefile) + " ", nonl=True)
+                subtree = self.env.get_doctree(includefile)
+            except Exception:
+                self.warn('toctree contains ref to nonexisting file %r' %
+                          includefile,
+                          self.env.doc2path(toctreenode['parent']))
+                continue
+            self.env.resolve_references(subtree, includefile, self)
+            sof = addnodes.start_of_file(docname=includefile)
+            # like inline_all_toctrees: the children keep their parent
+            sof.children = subtree.children
+            sof.parent = toctreenode.parent
+            for sectionnode in sof.traverse(nodes.section):
+                if 'docname' not in sectionnode:
+                    sectionnode['docname'] = includefile
+            if self.segments is None:
+                yield sof, None
+                continue
+            cells = []
+            yield sof, cells
+            del sof, subtree
+            docs = [[name, self.doc_digest(name)]
+                    for name in self.traversed[start:]]
+            self.segments.store(includefile, level, docs, cells)
+
+    def cached_segment(self, docname, level):
+        """
+        Return the cached segment of `docname` if it can be spliced in at
+        section `level`, else None.
+        """
+        entry = self.segments.lookup(docname, level, self.doc_digest)
+        if entry is None:
+            return None
+        # a document included elsewhere since must not appear twice
+        for name, digest in entry['docs']:
+            if name in self.traversed:
+                return None
+        return entry
+
     def write(self, *ignored):
         docnames = self.env.all_docs
 
@@ -213,16 +1025,40 @@ class SingleIPynbBuilder(IPynbBuilder):
         self.prepare_writing(docnames)
         self.info('done')
 
-        self.info(bold('assembling single document... '), nonl=True)
-        doctree = self.assemble_doctree()
-        # self.env.toc_secnumbers = self.assemble_toc_secnumbers()
-        # self.env.toc_fignumbers = self.assemble_toc_fignumbers()
-        self.info()
-        self.info(bold('writing... '), nonl=True)
+        if self.config.ipynb_stream_assembly or self.segments is not None:
+            # the translator pulls in the documents of each toctree as it
+            # reaches it, see iter_included
+            self.info(bold('writing single document... '), nonl=True)
+            doctree = self.env.get_doctree(self.config.master_doc)
+            doctree['docname'] = self.config.master_doc
+            self.env.resolve_references(doctree, self.config.master_doc,
+                                        self)
+            self.traversed = [self.config.master_doc]
+        else:
+            self.info(bold('assembling single document... '), nonl=True)
+            doctree = self.assemble_doctree()
+            # self.env.toc_secnumbers = self.assemble_toc_secnumbers()
+            # self.env.toc_fignumbers = self.assemble_toc_fignumbers()
+            self.info()
+            self.info(bold('writing... '), nonl=True)
         self.write_doc_serialized(self.config.master_doc, doctree)
         self.write_doc(self.config.master_doc, doctree)
+        self.merge_local_results()
+        for docname in docnames:
+            self.record_doc(docname)
         self.info('done')
 
+    def finish(self):
+        IPynbBuilder.finish(self)
+        if self.segments is not None:
+            self.segments.prune(self.env.found_docs)
+            if self.segments.dirty:
+                try:
+                    self.segments.save()
+                except (IOError, OSError) as err:
+                    self.warn("error writing file %s: %s" %
+                              (self.segments.filename, err))
+
     def assemble_toc_secnumbers(self):
         # Assemble toc_secnumbers to resolve section numbers on SingleHTML.
         # Merge all secnumbers to single secnumber.
@@ -251,7 +1087,8 @@ class SingleIPynbBuilder(IPynbBuilder):
         #       There are related codes in inline_all_toctres() and
         #       HTMLTranslter#add_fignumber().
         new_fignumbers = {}
-        # {u'foo': {'figure': {'id2': (2,), 'id1': (1,)}}, u'bar': {'figure': {'id1': (3,)}}}
+        # {u'foo': {'figure': {'id2': (2,), 'id1': (1,)}},
+        #  u'bar': {'figure': {'id1': (3,)}}}
         for docname, fignumlist in iteritems(self.env.toc_fignumbers):
             for figtype, fignums in iteritems(fignumlist):
                 new_fignumbers.setdefault((docname, figtype), {})
@@ -260,3 +1097,97 @@ class SingleIPynbBuilder(IPynbBuilder):
 
         return {self.config.master_doc: new_fignumbers}
 
+
+class IPynbArchiveBuilder(IPynbBuilder):
+    """
+    A IPynbBuilder subclass that streams all Jupyter Notebooks into one zip
+    or tar archive instead of writing them as separate files.
+    """
+
+    name = 'ipynbarchive'
+    # members go into the archive in docname order, from one process
+    allow_parallel = False
+    # large images go into the archive only
+    copy_assets = False
+
+    def init(self):
+        IPynbBuilder.init(self)
+        fmt = self.config.ipynb_archive_format
+        if fmt not in ARCHIVE_FORMATS:
+            raise ValueError('ipynb_archive_format must be one of %s, not "%s"'
+                             % (', '.join(sorted(ARCHIVE_FORMATS)), fmt))
+        self.archive_filename = path.join(
+            self.outdir, self.config.ipynb_archive_name + ARCHIVE_FORMATS[fmt])
+        self.archive = None
+
+    def get_outdated_docs(self):
+        # the archive is written as a whole, so every build writes all
+        return 'all documents'
+
+    def prepare_writing(self, docnames):
+        IPynbBuilder.prepare_writing(self, docnames)
+        ensuredir(self.outdir)
+        self.archive = NotebookArchive(self.archive_filename + '.tmp',
+                                       self.config.ipynb_archive_format,
+                                       self.compression_level,
+                                       self.config.ipynb_archive_index)
+
+    def write_output(self, outname, text):
+        """Add `text` to the archive as member `outname`."""
+        data = formats.compress(text.encode('utf-8'),
+                                self.config.ipynb_compression,
+                                self.compression_level)
+        try:
+            digest = self.archive.add(outname, data)
+            self.written[outname] = [None, digest, len(data), 'changed']
+        except (IOError, OSError) as err:
+            self.warn("error writing file %s: %s" %
+                      (self.archive_filename, err))
+
+    def write_stream(self, outname, doctree, destination):
+        """Translate `doctree` straight into the archive member `outname`."""
+        try:
+            with self.archive.member(outname) as out:
+                with formats.compressor(out, self.config.ipynb_compression,
+                                        self.compression_level) as f:
+                    self.writer.stream = NotebookStream(
+                        f, self.config.ipynb_minify_json)
+                    try:
+                        self.writer.write(doctree, destination)
+                    finally:
+                        self.writer.stream = None
+            self.written[outname] = [None, out.hexdigest(), out.size,
+                                     'changed']
+        except (IOError, OSError) as err:
+            self.warn("error writing file %s: %s" %
+                      (self.archive_filename, err))
+
+    def add_image_assets(self):
+        """
+        Add the image files the notebooks refer to, sorted by name, read
+        from the source directory.
+        """
+        sources = self.image_assets.sources
+        for assetname in sorted(sources):
+            with open(sources[assetname], 'rb') as f:
+                self.archive.add(assetname, f.read())
+
+    def start_validation(self):
+        if self.config.ipynb_validation == 'deferred':
+            self.warn('deferred validation cannot read archive members, '
+                      'use ipynb_validation = "inline"')
+        return None
+
+    def finish(self):
+        if self.archive is not None:
+            try:
+                if self.image_assets is not None:
+                    self.add_image_assets()
+                self.archive.close()
+                os.replace(self.archive_filename + '.tmp',
+                           self.archive_filename)
+            except (IOError, OSError) as err:
+                self.warn("error writing file %s: %s" %
+                          (self.archive_filename, err))
+            self.archive = None
+        IPynbBuilder.finish(self)
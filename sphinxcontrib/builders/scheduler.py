@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+    sphinxcontrib.builders.scheduler
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Size-aware scheduler for parallel notebook writing.
+
+    Sphinx splits the documents into equal-count chunks, which balances
+    badly when a few documents are much larger than the rest.  This
+    scheduler estimates the cost of every document from the size of its
+    pickled doctree, queues them largest first, and lets a fixed pool of
+    forked workers pull the next document as soon as they are idle.
+
+    :copyright: Copyright 2016 by Ad Thiers.
+    :license: BSD, see LICENSE.txt for details.
+"""
+
+import time
+import queue
+import traceback
+import multiprocessing
+
+from sphinx.errors import SphinxParallelError
+from sphinx.util import logging, status_iterator
+from sphinx.util.console import bold
+
+from .manifest import scan_tree
+
+DOCTREE_SUFFIX = '.doctree'
+POLL_INTERVAL = 1.0
+
+logger = logging.getLogger(__name__)
+
+
+class WriteScheduler(object):
+    """
+    Write `docnames` with `nproc` worker processes, largest document
+    first.
+    """
+
+    def __init__(self, builder, nproc):
+        self.builder = builder
+        self.nproc = max(1, nproc)
+        self.stats = {}
+
+    def estimate_costs(self, docnames):
+        """Return a dict mapping each docname to its pickled doctree size."""
+        sizes = scan_tree(self.builder.doctreedir)
+        costs = {}
+        for docname in docnames:
+            signature = sizes.get(docname + DOCTREE_SUFFIX)
+            costs[docname] = signature[1] if signature else 0
+        return costs
+
+    def _worker(self, wid, tasks, results):
+        builder = self.builder
+        start = time.perf_counter()
+        busy = 0.0
+        count = 0
+        builder.reset_results()
+        while True:
+            docname = tasks.get()
+            if docname is None:
+                break
+            results.put(('start', wid, docname))
+            t0 = time.perf_counter()
+            collector = logging.LogCollector()
+            try:
+                with collector.collect():
+                    doctree = builder.env.get_and_resolve_doctree(docname,
+                                                                  builder)
+                    builder.write_doc(docname, doctree)
+                    # what is finished so far; executions and writes of
+                    # this and earlier documents go on while the next one
+                    # is translated.  Their warnings go with this document.
+                    doc_results = builder.results(wait=False)
+            except BaseException as err:
+                errmsg = traceback.format_exception_only(err.__class__,
+                                                         err)[0].strip()
+                results.put(('error', wid, errmsg, traceback.format_exc()))
+                return
+            busy += time.perf_counter() - t0
+            count += 1
+            logging.convert_serializable(collector.logs)
+            results.put(('doc', wid, docname, collector.logs, doc_results))
+        collector = logging.LogCollector()
+        try:
+            with collector.collect():
+                final = builder.results()
+        except BaseException as err:
+            errmsg = traceback.format_exception_only(err.__class__,
+                                                     err)[0].strip()
+            results.put(('error', wid, errmsg, traceback.format_exc()))
+            return
+        logging.convert_serializable(collector.logs)
+        results.put(('done', wid, count, busy, time.perf_counter() - start,
+                     collector.logs, final))
+
+    def _results(self, procs, results):
+        # Yield docnames as the workers finish them; collect worker stats.
+        started = dict((wid, []) for wid in range(len(procs)))
+        running = set(range(len(procs)))
+        exited = set()
+        while running:
+            try:
+                message = results.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                # a worker that exited is only lost once its last messages
+                # had a poll interval to arrive
+                lost = set(wid for wid in exited if wid in running)
+                if lost:
+                    self.lost_workers(procs, lost, started)
+                exited = set(wid for wid in running
+                             if procs[wid].exitcode is not None)
+                continue
+            kind, wid = message[:2]
+            if kind == 'start':
+                started[wid].append(message[2])
+            elif kind == 'error':
+                for proc in procs:
+                    proc.terminate()
+                raise SphinxParallelError(*message[2:])
+            elif kind == 'doc':
+                docname, logs, doc_results = message[2:]
+                for log in logs:
+                    logger.handle(log)
+                self.builder.merge_results(doc_results)
+                yield docname
+            else:
+                count, busy, wall, logs, final = message[2:]
+                for log in logs:
+                    logger.handle(log)
+                self.builder.merge_results(final)
+                self.stats[wid] = (count, busy, wall)
+                # only now are its notebooks known to be written
+                del started[wid][:]
+                running.discard(wid)
+
+    def lost_workers(self, procs, lost, started):
+        """
+        Stop the build because the workers `lost` died without reporting,
+        naming the documents they had taken: their notebooks may still have
+        been queued for execution or writing.
+        """
+        for proc in procs:
+            if proc.exitcode is None:
+                proc.terminate()
+        docnames = sorted(docname for wid in lost for docname in started[wid])
+        raise SphinxParallelError(
+            'worker process %s exited (exit code %s) without finishing; '
+            'documents not written: %s' % (
+                ', '.join(str(wid) for wid in sorted(lost)),
+                ', '.join(str(procs[wid].exitcode) for wid in sorted(lost)),
+                ', '.join(docnames) or 'none'), '')
+
+    def run(self, docnames):
+        costs = self.estimate_costs(docnames)
+        order = sorted(docnames, key=lambda docname: (-costs[docname],
+                                                      docname))
+
+        # The main process only hands out work, so it does the serialized
+        # part of writing up front.
+        for docname in order:
+            self.builder.write_doc_serialized(docname, None)
+
+        ctx = multiprocessing.get_context('fork')
+        tasks = ctx.Queue()
+        results = ctx.Queue()
+        for docname in order:
+            tasks.put(docname)
+        for i in range(self.nproc):
+            tasks.put(None)
+
+        start = time.perf_counter()
+        procs = [ctx.Process(target=self._worker, args=(wid, tasks, results))
+                 for wid in range(self.nproc)]
+        for proc in procs:
+            proc.start()
+        for docname in status_iterator(self._results(procs, results),
+                                       'writing output... ', 'darkgreen',
+                                       len(order),
+                                       self.builder.app.verbosity):
+            pass
+        for proc in procs:
+            proc.join()
+        self.report(time.perf_counter() - start)
+
+    def report(self, elapsed):
+        """Log the number of documents and the utilisation per worker."""
+        self.builder.info(bold('worker utilisation:'))
+        total = 0.0
+        for wid in sorted(self.stats):
+            count, busy, wall = self.stats[wid]
+            total += busy
+            self.builder.info('  worker %d: %d docs, %.2fs busy, %.1f%%' %
+                              (wid, count, busy,
+                               100.0 * busy / elapsed if elapsed else 0.0))
+        if self.stats and elapsed:
+            self.builder.info('  overall: %.1f%% of %d workers over %.2fs' %
+                              (100.0 * total / (elapsed * len(self.stats)),
+                               len(self.stats), elapsed))
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+    sphinxcontrib.builders.segments
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Cache of translated cell segments for the single notebook builder.
+
+    A segment holds the cells translated from one document of the toctree,
+    including the documents of its own toctrees.  It is stored with the
+    digest of every document it covers and the section level it was
+    translated at, so an unchanged document is spliced into the next
+    single notebook without loading or translating its doctree.
+
+    :copyright: Copyright 2016 by Ad Thiers.
+    :license: BSD, see LICENSE.txt for details.
+"""
+
+import os
+import json
+
+import nbformat
+
+CACHE_VERSION = 1
+
+
+class SegmentCache(object):
+    """
+    Segments by docname.  Each entry is a dict with the keys ``level``
+    (section level at the toctree), ``docs`` (``[docname, digest]`` pairs
+    of the document and the documents it includes, in traversal order)
+    and ``cells``.  The cache is discarded when `fingerprint`, a digest of
+    the configuration, changes.
+    """
+
+    def __init__(self, filename, fingerprint):
+        self.filename = filename
+        self.fingerprint = fingerprint
+        self.entries = {}
+        self.dirty = False
+
+    @classmethod
+    def load(cls, filename, fingerprint):
+        cache = cls(filename, fingerprint)
+        try:
+            with open(filename, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            return cache
+        if data.get('version') == CACHE_VERSION and \
+                data.get('fingerprint') == fingerprint:
+            cache.entries = data.get('segments', {})
+            for entry in cache.entries.values():
+                entry['cells'] = [nbformat.from_dict(cell)
+                                  for cell in entry['cells']]
+        return cache
+
+    def save(self):
+        data = {
+            'version': CACHE_VERSION,
+            'fingerprint': self.fingerprint,
+            'segments': self.entries,
+        }
+        tmpname = self.filename + '.tmp'
+        with open(tmpname, 'w', encoding='utf-8') as f:
+            json.dump(data, f, sort_keys=True)
+        os.replace(tmpname, self.filename)
+        self.dirty = False
+
+    def lookup(self, docname, level, digest):
+        """
+        Return the entry of `docname` if it was translated at section
+        `level` and every document it covers still has the digest given by
+        the callable `digest`, else None.
+        """
+        entry = self.entries.get(docname)
+        if entry is None or entry['level'] != level:
+            return None
+        for name, known in entry['docs']:
+            if digest(name) != known:
+                return None
+        return entry
+
+    def store(self, docname, level, docs, cells):
+        """
+        Remember the `cells` of `docname` at section `level`; `docs` are
+        the ``[docname, digest]`` pairs of the documents covered.
+        """
+        self.entries[docname] = {'level': level, 'docs': docs,
+                                 'cells': cells}
+        self.dirty = True
+
+    def prune(self, docnames):
+        """Forget about documents that are not in `docnames`."""
+        for docname in set(self.entries) - set(docnames):
+            del self.entries[docname]
+            self.dirty = True
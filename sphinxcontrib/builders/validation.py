@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+    sphinxcontrib.builders.validation
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Notebook schema validation for the Jupyter Notebook builders.
+
+    Depending on ``ipynb_validation`` notebooks are not validated at all
+    (``'off'``), validated by the translator as they are produced
+    (``'inline'``), or validated after all notebooks have been written, in
+    a pool of worker processes (``'deferred'``).
+
+    :copyright: Copyright 2016 by Ad Thiers.
+    :license: BSD, see LICENSE.txt for details.
+"""
+
+import json
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+import nbformat
+
+from ..writers.formats import open_notebook
+
+VALIDATION_MODES = ('off', 'inline', 'deferred')
+
+
+def validation_error(nb, ref=None):
+    """
+    Return the validation error of `nb` as a string, or None.  With `ref`,
+    `nb` is a part of a v4 notebook, such as ``'markdown_cell'``.
+    """
+    kwargs = {}
+    if ref is not None:
+        # a cell carries no version to pick the schema from
+        kwargs = {'version': nbformat.v4.nbformat,
+                  'version_minor': nbformat.v4.nbformat_minor}
+    try:
+        nbformat.validate(nb, ref=ref, **kwargs)
+    except nbformat.ValidationError as err:
+        return str(err).split('\n', 1)[0]
+    return None
+
+
+def validate_file(filename):
+    """Return the validation error of a notebook file, or None."""
+    try:
+        with open_notebook(filename) as f:
+            nb = json.load(f)
+    except (IOError, OSError, EOFError, ValueError) as err:
+        return str(err)
+    return validation_error(nb)
+
+
+class DeferredValidation(object):
+    """
+    Validate notebook files in the background.  :meth:`start` submits the
+    files to a process pool and returns immediately; :meth:`report` waits
+    for the results.
+    """
+
+    def __init__(self, filenames, sample=None, nproc=None):
+        filenames = sorted(filenames)
+        if sample is not None and sample < 1 and filenames:
+            count = max(1, int(round(len(filenames) * sample)))
+            filenames = sorted(random.sample(filenames, count))
+        self.filenames = filenames
+        self.nproc = nproc
+        self.executor = None
+        self.results = None
+
+    def start(self):
+        if not self.filenames:
+            return
+        self.executor = ProcessPoolExecutor(self.nproc)
+        chunksize = max(1, len(self.filenames) // (4 * (self.nproc or 4)))
+        self.results = self.executor.map(validate_file, self.filenames,
+                                         chunksize=chunksize)
+
+    def report(self):
+        """Return a list of (filename, error) pairs for invalid notebooks."""
+        if self.executor is None:
+            return []
+        try:
+            return [(filename, error) for filename, error
+                    in zip(self.filenames, self.results) if error]
+        finally:
+            self.executor.shutdown()
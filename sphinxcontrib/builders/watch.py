@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+"""
+    sphinxcontrib.builders.watch
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Watch mode for the Jupyter Notebook builders.
+
+    One Sphinx application is created and kept for the whole session, so
+    the interpreter, the extensions and the pickled environment are loaded
+    once.  The source directory is polled for changed stat signatures; on a
+    change Sphinx re-reads the outdated documents and the builder rewrites
+    the notebooks whose content changed.  A change of ``conf.py`` starts a
+    new application.
+
+    Optionally the output directory is served over HTTP.  Every file gets
+    an ETag from its stat signature, and unchanged notebooks are never
+    rewritten, so a previewer revalidating with ``If-None-Match`` only
+    downloads changed notebooks.  ``/_changes?since=N&timeout=S`` waits up
+    to S seconds for a rebuild after generation N and lists the notebooks
+    it changed.
+
+    Usage::
+
+        python -m sphinxcontrib.builders.watch [-b ipynb] [-D name=value]
+            [--serve PORT] sourcedir outputdir
+
+    :copyright: Copyright 2016 by Ad Thiers.
+    :license: BSD, see LICENSE.txt for details.
+"""
+
+import os
+import sys
+import json
+import stat
+import time
+import argparse
+import threading
+from os import path
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+from sphinx.application import Sphinx
+from sphinx.util.docutils import docutils_namespace, patch_docutils
+
+from .manifest import scan_tree
+
+CHANGES_PATH = '/_changes'
+MAX_WAIT = 60
+
+
+class ChangeLog(object):
+    """
+    The output files changed by each rebuild.  Every rebuild is a new
+    generation; only the last generation that changed a file is kept.
+    """
+
+    def __init__(self):
+        self.generation = 0
+        self.changed = {}
+        self.condition = threading.Condition()
+
+    def add(self, outnames):
+        """Start a new generation that changed `outnames`."""
+        with self.condition:
+            self.generation += 1
+            for outname in outnames:
+                self.changed[outname] = self.generation
+            self.condition.notify_all()
+
+    def since(self, generation, timeout=0):
+        """
+        Wait up to `timeout` seconds for a generation after `generation`
+        and return ``(generation, outnames)`` of the files changed since.
+        """
+        with self.condition:
+            if timeout:
+                self.condition.wait_for(
+                    lambda: self.generation > generation, timeout)
+            return self.generation, sorted(
+                outname for outname, changed in self.changed.items()
+                if changed > generation)
+
+
+class NotebookRequestHandler(SimpleHTTPRequestHandler):
+    """Serves the output directory with ETags and the change log."""
+
+    extensions_map = dict(SimpleHTTPRequestHandler.extensions_map)
+    extensions_map['.ipynb'] = 'application/x-ipynb+json'
+
+    etag = None
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == CHANGES_PATH:
+            self.send_changes(parse_qs(url.query))
+        elif not self.not_modified():
+            SimpleHTTPRequestHandler.do_GET(self)
+
+    def do_HEAD(self):
+        if not self.not_modified():
+            SimpleHTTPRequestHandler.do_HEAD(self)
+
+    def not_modified(self):
+        """
+        Set the ETag of the requested file and answer 304 if the client
+        has it already.
+        """
+        self.etag = None
+        try:
+            st = os.stat(self.translate_path(self.path))
+        except OSError:
+            return False
+        if not stat.S_ISREG(st.st_mode):
+            return False
+        self.etag = '"%x-%x"' % (st.st_mtime_ns, st.st_size)
+        tags = [tag.strip() for tag in
+                self.headers.get('If-None-Match', '').split(',')]
+        if self.etag not in tags and '*' not in tags:
+            return False
+        self.send_response(304)
+        self.end_headers()
+        return True
+
+    def end_headers(self):
+        if self.etag is not None:
+            self.send_header('ETag', self.etag)
+            # always revalidate, the next rebuild may change the file
+            self.send_header('Cache-Control', 'no-cache')
+        SimpleHTTPRequestHandler.end_headers(self)
+
+    def send_changes(self, query):
+        try:
+            since = int(query.get('since', ['0'])[0])
+            timeout = min(float(query.get('timeout', ['0'])[0]), MAX_WAIT)
+        except ValueError:
+            self.send_error(400, 'since and timeout must be numbers')
+            return
+        generation, outnames = self.server.changes.since(since, timeout)
+        data = json.dumps({'generation': generation,
+                           'changed': outnames}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class NotebookServer(ThreadingHTTPServer):
+    """HTTP server for `outdir`, with `changes` for the change log."""
+
+    daemon_threads = True
+
+    def __init__(self, address, outdir, changes):
+        self.outdir = outdir
+        self.changes = changes
+        ThreadingHTTPServer.__init__(self, address, NotebookRequestHandler)
+
+    def finish_request(self, request, client_address):
+        self.RequestHandlerClass(request, client_address, self,
+                                 directory=self.outdir)
+
+
+class NotebookWatcher(object):
+    """
+    Rebuild the notebooks of `srcdir` into `outdir` with a warm Sphinx
+    application whenever a source file changes, polling every `interval`
+    seconds.  The other arguments are those of
+    :class:`sphinx.application.Sphinx`.
+    """
+
+    def __init__(self, srcdir, confdir, outdir, doctreedir, buildername,
+                 confoverrides=None, parallel=0, interval=1.0):
+        self.srcdir = path.abspath(srcdir)
+        self.confdir = path.abspath(confdir)
+        self.outdir = path.abspath(outdir)
+        self.doctreedir = path.abspath(doctreedir)
+        self.buildername = buildername
+        self.confoverrides = confoverrides or {}
+        self.parallel = parallel
+        self.interval = interval
+        self.changes = ChangeLog()
+        self.app = None
+
+    def create_app(self):
+        self.app = Sphinx(self.srcdir, self.confdir, self.outdir,
+                          self.doctreedir, self.buildername,
+                          dict(self.confoverrides), parallel=self.parallel)
+
+    def conf_signature(self):
+        try:
+            st = os.stat(path.join(self.confdir, 'conf.py'))
+        except OSError:
+            return None
+        return [st.st_mtime_ns, st.st_size]
+
+    def sources(self):
+        """Return the stat signatures of the files of the source tree."""
+        exclude = [self.outdir, self.doctreedir]
+        try:
+            # .git and the like are large and never documents
+            exclude.extend(path.join(self.srcdir, name)
+                           for name in os.listdir(self.srcdir)
+                           if name.startswith('.'))
+        except OSError:
+            pass
+        return scan_tree(self.srcdir, exclude=exclude)
+
+    def build(self):
+        """Run an incremental build and log the notebooks it changed."""
+        manifest = getattr(self.app.builder, 'manifest', None)
+        before = dict(manifest.outputs) if manifest else {}
+        start = time.time()
+        try:
+            self.app.build()
+        except Exception as err:
+            # the environment may be half updated; start from disk
+            self.app.builder.warn('build failed: %s' % err)
+            self.app = None
+            return
+        after = dict(manifest.outputs) if manifest else {}
+        changed = sorted(outname for outname, record in after.items()
+                         if before.get(outname) != record)
+        changed.extend(sorted(set(before) - set(after)))
+        self.changes.add(changed)
+        self.app.builder.info('%d notebooks changed in %.2f s, watching '
+                              'for changes...' %
+                              (len(changed), time.time() - start))
+
+    def run(self):
+        """Build, then rebuild on every change until interrupted."""
+        conf = self.conf_signature()
+        sources = self.sources()
+        self.create_app()
+        self.build()
+        while True:
+            time.sleep(self.interval)
+            new_conf = self.conf_signature()
+            new_sources = self.sources()
+            if new_conf == conf and new_sources == sources:
+                continue
+            if new_conf != conf or self.app is None:
+                self.create_app()
+            conf, sources = new_conf, new_sources
+            self.build()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m sphinxcontrib.builders.watch',
+        description='Rebuild Jupyter Notebooks when their sources change.')
+    parser.add_argument('sourcedir')
+    parser.add_argument('outputdir')
+    parser.add_argument('-b', dest='builder', default='ipynb',
+                        choices=['ipynb', 'singleipynb'])
+    parser.add_argument('-c', dest='confdir',
+                        help='directory of conf.py (default: sourcedir)')
+    parser.add_argument('-d', dest='doctreedir',
+                        help='doctree directory (default: '
+                             'outputdir/.doctrees)')
+    parser.add_argument('-D', dest='define', action='append', default=[],
+                        metavar='name=value',
+                        help='override a configuration value')
+    parser.add_argument('-j', dest='jobs', type=int, default=0,
+                        help='parallel processes for Sphinx')
+    parser.add_argument('--interval', type=float, default=1.0,
+                        help='seconds between polls (default 1)')
+    parser.add_argument('--serve', type=int, metavar='PORT',
+                        help='serve the output directory on this port')
+    parser.add_argument('--bind', default='127.0.0.1',
+                        help='address to serve on (default 127.0.0.1)')
+    args = parser.parse_args(argv)
+
+    try:
+        overrides = dict(item.split('=', 1) for item in args.define)
+    except ValueError:
+        parser.error('-D needs name=value')
+    watcher = NotebookWatcher(
+        args.sourcedir, args.confdir or args.sourcedir, args.outputdir,
+        args.doctreedir or path.join(args.outputdir, '.doctrees'),
+        args.builder, overrides, args.jobs, args.interval)
+    server = None
+    if args.serve is not None:
+        os.makedirs(watcher.outdir, exist_ok=True)
+        server = NotebookServer((args.bind, args.serve), watcher.outdir,
+                                watcher.changes)
+        thread = threading.Thread(target=server.serve_forever,
+                                  name='ipynb-serve', daemon=True)
+        thread.start()
+        print('serving %s on http://%s:%d/' %
+              (watcher.outdir, args.bind, server.server_address[1]))
+    try:
+        with patch_docutils(watcher.confdir), docutils_namespace():
+            watcher.run()
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
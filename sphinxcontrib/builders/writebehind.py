@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+    sphinxcontrib.builders.writebehind
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Write-behind queue for notebook files.
+
+    Rendered notebooks are handed to a small pool of threads, so the next
+    document is translated while earlier ones are still being written.  At
+    most a fixed number of notebooks wait in the queue; the builder blocks
+    when it is full.  Every file is written to a temporary file first and
+    moved into place, so no reader ever sees a partially written notebook.
+
+    :copyright: Copyright 2016 by Ad Thiers.
+    :license: BSD, see LICENSE.txt for details.
+"""
+
+import os
+import threading
+import collections
+from os import path
+from concurrent.futures import ThreadPoolExecutor
+
+from sphinx.util.osutil import ensuredir
+
+
+def write_file(filename, data):
+    """Write the bytes `data` to `filename` through a temporary file."""
+    ensuredir(path.dirname(filename))
+    tmpname = filename + '.tmp'
+    try:
+        with open(tmpname, 'wb') as f:
+            f.write(data)
+        os.replace(tmpname, filename)
+    except (IOError, OSError):
+        try:
+            os.remove(tmpname)
+        except OSError:
+            pass
+        raise
+
+
+class WriteBehind(object):
+    """
+    Write files from `threads` threads, with at most `maxsize` of them
+    queued or being written at a time.  A queue belongs to the process
+    that created it (`pid`); threads do not survive a fork.
+    """
+
+    def __init__(self, threads, maxsize):
+        self.executor = ThreadPoolExecutor(threads,
+                                           thread_name_prefix='ipynb-write')
+        self.slots = threading.BoundedSemaphore(max(1, maxsize))
+        self.pending = collections.deque()
+        self.pid = os.getpid()
+
+    def submit(self, key, filename, data):
+        """
+        Queue writing `data` to `filename`, blocking while the queue is
+        full.  `key` comes back with the outcome from :meth:`completed`.
+        """
+        self.slots.acquire()
+        try:
+            future = self.executor.submit(write_file, filename, data)
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda future: self.slots.release())
+        self.pending.append((key, filename, future))
+
+    def completed(self, wait=False):
+        """
+        Yield ``(key, filename, error)`` for the writes that finished, in
+        the order they were queued, where `error` is None on success.  With
+        `wait`, wait for all of them.
+        """
+        while self.pending and (wait or self.pending[0][2].done()):
+            key, filename, future = self.pending.popleft()
+            try:
+                future.result()
+            except (IOError, OSError) as err:
+                yield key, filename, err
+            else:
+                yield key, filename, None
+
+    def shutdown(self):
+        self.executor.shutdown()
@@ -13,22 +13,54 @@
 
 from __future__ import (print_function, unicode_literals, absolute_import)
 
-from sphinx.writers.text import STDINDENT
-from .builders.nb import IPynbBuilder, SingleIPynbBuilder
+import importlib
+
+# sphinx.writers.text.STDINDENT; that module is not loaded by other builders
+STDINDENT = 3
+
+BUILDERS = [
+    ('ipynb', 'IPynbBuilder'),
+    ('singleipynb', 'SingleIPynbBuilder'),
+    ('ipynbarchive', 'IPynbArchiveBuilder'),
+]
+"""Name and class in `sphinxcontrib.builders.nb` of every builder."""
+
+
+def lazy_builder(name, classname):
+    """
+    Return a stand-in for the builder class `classname`, registered under
+    `name`, that imports the builders, the writer and nbformat only when
+    Sphinx creates the builder.  Runs with other builders, such as html or
+    linkcheck, then do not pay for importing them.
+    """
+    def __new__(cls, app):
+        module = importlib.import_module('.builders.nb', __package__)
+        return getattr(module, classname)(app)
+
+    return type(classname, (object,), {
+        'name': name,
+        '__new__': __new__,
+        '__module__': __name__,
+        '__doc__': 'Loads :class:`sphinxcontrib.builders.nb.%s`.' % classname,
+    })
 
 
 def setup(app):
     app.require_sphinx('1.0')
-    app.add_builder(IPynbBuilder)
-    app.add_builder(SingleIPynbBuilder)
-    app.add_config_value('ipynb_file_suffix', ".ipynb", False)
-    """This is the file name suffix for Jupyter Notebook files"""
+    for name, classname in BUILDERS:
+        app.add_builder(lazy_builder(name, classname))
+    app.add_config_value('ipynb_file_suffix', None, False)
+    """This is the file name suffix for Jupyter Notebook files. By default,
+    '.ipynb' plus the extension of ipynb_compression, such as '.ipynb.gz'."""
     app.add_config_value('ipynb_link_suffix', None, False)
-    """The is the suffix used in internal links. By default, takes the same value as ipynb_file_suffix"""
+    """The is the suffix used in internal links. By default, takes the same
+    value as ipynb_file_suffix"""
     app.add_config_value('ipynb_file_transform', None, False)
-    """Function to translate a docname to a filename. By default, returns docname + ipynb_file_suffix."""
+    """Function to translate a docname to a filename. By default, returns
+    docname + ipynb_file_suffix."""
     app.add_config_value('ipynb_link_transform', None, False)
-    """Function to translate a docname to a (partial) URI. By default, returns docname + ipynb_link_suffix."""
+    """Function to translate a docname to a (partial) URI. By default,
+    returns docname + ipynb_link_suffix."""
     app.add_config_value('ipynb_indent', STDINDENT, False)
     app.add_config_value('ipynb_kernel', None, False)
     """This is the kernel for the Jupyter notebook."""
@@ -39,5 +71,77 @@ def setup(app):
     app.add_config_value('ipynb_author', None, False)
     app.add_config_value('ipynb_extra_path', [], False)
     app.add_config_value('ipynb_static_path', ['_static'], False)
-
-
+    app.add_config_value('ipynb_minify_json', False, False)
+    """Write notebooks as minified JSON instead of indented JSON."""
+    app.add_config_value('ipynb_compression', None, False)
+    """Compress notebooks: None, 'gzip' or 'xz'."""
+    app.add_config_value('ipynb_compression_level', None, False)
+    """gzip level (1-9, default 9) or xz preset (0-9, default 6)."""
+    app.add_config_value('ipynb_build_manifest', 'ipynb-manifest.json', False)
+    """File in the output directory listing the path, size, sha256 and
+    changed/unchanged status of every notebook. Set to None to disable."""
+    app.add_config_value('ipynb_write_scheduler', 'size', False)
+    """How parallel builds distribute documents: 'size' (largest doctree
+    first, idle workers pull the next one) or 'chunks' (Sphinx default)."""
+    app.add_config_value('ipynb_write_threads', 4, False)
+    """Threads writing notebooks while the next documents are translated;
+    0 writes every notebook before translating the next document."""
+    app.add_config_value('ipynb_write_queue', 16, False)
+    """Number of notebooks the write threads may fall behind by."""
+    app.add_config_value('ipynb_stream_output', False, False)
+    """Write each cell to the notebook file as soon as it is translated."""
+    app.add_config_value('ipynb_stream_assembly', False, False)
+    """singleipynb: translate the documents one at a time while walking the
+    toctrees instead of first inlining them all into one doctree."""
+    app.add_config_value('ipynb_segment_cache', False, False)
+    """singleipynb: cache the cells of every document and reuse them for
+    unchanged documents; implies ipynb_stream_assembly."""
+    app.add_config_value('ipynb_profile', None, False)
+    """File in the output directory to dump the per handler and per document
+    translator profile to; profiling is off when None."""
+    app.add_config_value('ipynb_cell_min_size', None, False)
+    """Merge adjacent markdown cells when one is smaller than this."""
+    app.add_config_value('ipynb_cell_max_size', None, False)
+    """Split markdown cells larger than this at sections or paragraphs."""
+    app.add_config_value('ipynb_split_level', None, False)
+    """Start a new notebook at every section of this level or above."""
+    app.add_config_value('ipynb_split_bytes', None, False)
+    """Start a new notebook at the next section once a notebook has this
+    many characters of cell source."""
+    app.add_config_value('ipynb_split_cells', None, False)
+    """Start a new notebook at the next section once a notebook has this
+    many cells."""
+    app.add_config_value('ipynb_table_csv_rows', 1000, False)
+    """Tables with more body rows than this become CSV data in a code cell
+    that loads them when run; None to always use Markdown tables."""
+    app.add_config_value('ipynb_execute', False, False)
+    """Run the code cells with a local Jupyter kernel and store the outputs
+    in the notebooks, reusing cached outputs of unchanged cells."""
+    app.add_config_value('ipynb_execution_kernel', 'python3', False)
+    """Name of the local Jupyter kernel spec to execute the notebooks with."""
+    app.add_config_value('ipynb_execution_kernels', 2, False)
+    """Number of kernels, and so of notebooks executing at the same time."""
+    app.add_config_value('ipynb_execution_timeout', 60, False)
+    """Seconds a code cell may run before its execution counts as failed."""
+    app.add_config_value('ipynb_execution_allow_errors', False, False)
+    """Keep executing a notebook after a code cell raised an error."""
+    app.add_config_value('ipynb_validation', 'inline', False)
+    """Notebook schema validation: 'off', 'inline' (while translating) or
+    'deferred' (after the build, in a process pool)."""
+    app.add_config_value('ipynb_validation_sample', None, False)
+    """Fraction of the notebooks to validate in 'deferred' mode; None for
+    all."""
+    app.add_config_value('ipynb_embed_images', False, False)
+    """Embed images as cell attachments or content-addressed asset files."""
+    app.add_config_value('ipynb_embed_max_size', 64 * 1024, False)
+    """Images up to this many bytes become attachments, larger ones files."""
+    app.add_config_value('ipynb_image_dir', '_images', False)
+    """Directory in the output directory for the shared image files."""
+    app.add_config_value('ipynb_archive_format', 'zip', False)
+    """ipynbarchive: 'zip', 'tar', 'tar.gz' or 'tar.xz'."""
+    app.add_config_value('ipynb_archive_name', 'notebooks', False)
+    """ipynbarchive: archive file name in the output directory, without the
+    extension of ipynb_archive_format."""
+    app.add_config_value('ipynb_archive_index', 'index.json', False)
+    """ipynbarchive: name of the last member, listing the path, size and
+    sha256 of the others in archive order; None for no index."""
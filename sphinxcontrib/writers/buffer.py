@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+    sphinxcontrib.writers.buffer
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Text buffer for the source of the notebook cell being translated.
+
+    The translator appends many small fragments per node.  Keeping them in
+    a list holds on to every fragment until the cell is finished; the
+    buffer copies them into one growing string buffer instead, so the
+    fragments are released right away.
+
+    :copyright: Copyright 2016 by Ad Thiers.
+    :license: BSD, see LICENSE.txt for details.
+"""
+
+from io import StringIO
+
+
+class CellBuffer(object):
+    """
+    Accumulates the source of one cell.  Supports ``append`` like the list
+    it replaces, knows its last character in O(1) and can return the text
+    between two positions obtained from :meth:`mark`.
+    """
+
+    __slots__ = ('_buf', '_length', '_used', 'last')
+
+    def __init__(self):
+        self._buf = StringIO()
+        self._length = 0
+        self._used = False
+        self.last = ''
+        """Last character of the last fragment appended, if any."""
+
+    def append(self, text):
+        self._used = True
+        self.last = text[-1:]
+        if text:
+            self._buf.write(text)
+            self._length += len(text)
+
+    def __bool__(self):
+        # True once anything, even an empty string, has been appended
+        return self._used
+
+    __nonzero__ = __bool__
+
+    def mark(self):
+        """Return the current position, for use with :meth:`text`."""
+        return self._length
+
+    def text(self, start=0, end=None):
+        """Return the text between positions `start` and `end`."""
+        if end is None:
+            end = self._length
+        if start == 0 and end == self._length:
+            return self._buf.getvalue()
+        self._buf.seek(start)
+        text = self._buf.read(end - start)
+        self._buf.seek(self._length)
+        return text
+
+    def getvalue(self):
+        return self._buf.getvalue()
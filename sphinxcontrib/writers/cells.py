@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+    sphinxcontrib.writers.cells
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Cell granularity policy for the Jupyter Notebook translator.
+
+    The translator starts a markdown cell after every code cell, so a page
+    comes out as many tiny markdown cells or, without code, as a single
+    huge one.  The balancer merges adjacent markdown cells smaller than a
+    minimum size and splits markdown cells larger than a maximum size at
+    section or paragraph boundaries.  It works cell by cell, so it can
+    sit in front of a notebook stream as well as run over a cell list.
+
+    :copyright: Copyright 2016 by Ad Thiers.
+    :license: BSD, see LICENSE.txt for details.
+"""
+
+import re
+
+from nbformat import NotebookNode
+
+# HTML blocks a blank line inside of must not be cut at
+BLOCK_TAGS = re.compile(r'<(/?)(?:table|div|ul|ol|dl|blockquote|pre)\b',
+                        re.I)
+
+# the anchors the translator puts before a heading
+ANCHORS = re.compile(r'^(?:<a id="[^"]*"></a>)+\s*$')
+
+
+def boundaries(text):
+    """
+    Yield ``(offset, section)`` for every blank line in `text` outside
+    code fences and HTML blocks, where `offset` is the position after the
+    blank line and `section` whether a heading, perhaps after its anchors,
+    follows it.  A fence closed
+    at the end of a line of code, as older notebooks have it, counts as
+    closed.
+    """
+    lines = text.splitlines(True)
+    fence = False
+    depth = 0
+    offset = 0
+    for i, line in enumerate(lines):
+        offset += len(line)
+        stripped = line.strip()
+        if stripped.startswith('```'):
+            fence = not fence
+            continue
+        if fence:
+            if stripped.endswith('```'):
+                fence = False
+            continue
+        for closing in BLOCK_TAGS.findall(line):
+            depth += -1 if closing else 1
+        if not stripped and depth <= 0 and i + 1 < len(lines):
+            following = i + 1
+            while following + 1 < len(lines) and \
+                    ANCHORS.match(lines[following]):
+                following += 1
+            yield offset, lines[following].startswith('#')
+
+
+def split_text(text, min_size, max_size):
+    """
+    Cut `text` into pieces of at most `max_size` characters where it can,
+    preferring cuts before headings that leave at least `min_size`
+    characters in the piece.
+    """
+    pieces = []
+    start = 0
+    candidates = []
+
+    def cut():
+        sections = [offset for offset, section in candidates
+                    if section and offset - start >= min_size]
+        return sections[-1] if sections else candidates[-1][0]
+
+    for offset, section in boundaries(text):
+        if offset - start > max_size and candidates:
+            end = cut()
+            pieces.append(text[start:end])
+            start = end
+            candidates = [c for c in candidates if c[0] > end]
+        candidates.append((offset, section))
+    while len(text) - start > max_size and candidates:
+        end = cut()
+        pieces.append(text[start:end])
+        start = end
+        candidates = [c for c in candidates if c[0] > end]
+    pieces.append(text[start:])
+    return pieces
+
+
+def join_text(first, second):
+    """Join the sources of two markdown cells with a blank line."""
+    if not first.endswith('\n'):
+        first += '\n'
+    if not second.startswith('\n'):
+        second = '\n' + second
+    return first + second
+
+
+class CellBalancer(object):
+    """
+    Merges adjacent markdown cells when one of them is smaller than
+    `min_size` characters and the result is at most `max_size`, and splits
+    markdown cells larger than `max_size`.  A size of 0 disables that
+    half.  `new_cell` creates the cells for the additional pieces.
+
+    Feed the cells in order to :meth:`push`, which returns the cells that
+    are final, and finish with :meth:`close`.  The cells given are not
+    modified.
+    """
+
+    def __init__(self, min_size, max_size, new_cell):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.new_cell = new_cell
+        self.pending = None
+
+    def push(self, cell):
+        if cell['cell_type'] != 'markdown':
+            return self.close() + [cell]
+        pending = self.pending
+        if pending is not None and self.min_size and \
+                (len(pending['source']) < self.min_size or
+                 len(cell['source']) < self.min_size) and \
+                (not self.max_size or len(pending['source']) +
+                 len(cell['source']) + 2 <= self.max_size):
+            pending['source'] = join_text(pending['source'], cell['source'])
+            if 'attachments' in cell:
+                attachments = dict(pending.get('attachments', {}))
+                attachments.update(cell['attachments'])
+                pending['attachments'] = attachments
+            return []
+        ready = self.close()
+        # a copy, the cell may be held by a cached segment as well
+        self.pending = NotebookNode(cell)
+        return ready
+
+    def close(self):
+        """Return the cell held back for merging, split if too large."""
+        cell, self.pending = self.pending, None
+        if cell is None:
+            return []
+        if not self.max_size or len(cell['source']) <= self.max_size:
+            return [cell]
+        pieces = split_text(cell['source'], self.min_size, self.max_size)
+        if len(pieces) == 1:
+            return [cell]
+        attachments = cell.pop('attachments', None)
+        cells = [cell] + [self.new_cell('markdown') for piece in pieces[1:]]
+        for cell, piece in zip(cells, pieces):
+            cell['source'] = piece
+            if attachments:
+                used = dict((name, bundle)
+                            for name, bundle in attachments.items()
+                            if 'attachment:' + name in piece)
+                if used:
+                    cell['attachments'] = used
+        return cells
+
+    def balance(self, cells):
+        """Return the balanced version of a whole list of `cells`."""
+        result = []
+        for cell in cells:
+            result.extend(self.push(cell))
+        result.extend(self.close())
+        return result
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+    sphinxcontrib.writers.formats
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Output formats of the Jupyter Notebook builders.
+
+    Notebooks are written as the indented JSON of ``nbformat`` by default,
+    or as minified JSON without indentation and with each source as one
+    string.  Either can be compressed with gzip or xz.  Compressed output
+    does not depend on the time of the build, so an unchanged notebook
+    compresses to the same bytes.
+
+    :copyright: Copyright 2016 by Ad Thiers.
+    :license: BSD, see LICENSE.txt for details.
+"""
+
+import copy
+import gzip
+import json
+import lzma
+import hashlib
+import contextlib
+
+from nbformat import v4 as ipynb
+from nbformat.v4.nbjson import BytesEncoder
+from nbformat.v4.rwbase import strip_transient
+
+COMPRESSIONS = {None: '', 'gzip': '.gz', 'xz': '.xz'}
+"""File name extension added by each compression."""
+
+GZIP_MAGIC = b'\x1f\x8b'
+XZ_MAGIC = b'\xfd7zXZ\x00'
+
+MINIFIED_OPTIONS = {
+    'cls': BytesEncoder,
+    'sort_keys': True,
+    'separators': (',', ':'),
+    'ensure_ascii': False,
+}
+
+
+def file_suffix(compression):
+    """Return the default notebook file suffix for `compression`."""
+    return '.ipynb' + COMPRESSIONS[compression]
+
+
+def writes(nb, minify=False):
+    """Serialize the notebook `nb` as indented or minified JSON."""
+    if not minify:
+        return ipynb.writes(nb)
+    # like nbformat's JSONWriter, without indentation and split lines
+    return json.dumps(strip_transient(copy.deepcopy(nb)), **MINIFIED_OPTIONS)
+
+
+def compress(data, compression, level=None):
+    """Return the bytes `data` compressed with `compression`."""
+    if compression == 'gzip':
+        return gzip.compress(data, 9 if level is None else level, mtime=0)
+    if compression == 'xz':
+        return lzma.compress(data, preset=level)
+    return data
+
+
+def compressor(f, compression, level=None):
+    """
+    Return a context manager giving a binary file object that compresses
+    what is written to it into the binary file `f`.
+    """
+    if compression == 'gzip':
+        return gzip.GzipFile(filename='', mode='wb', fileobj=f, mtime=0,
+                             compresslevel=9 if level is None else level)
+    if compression == 'xz':
+        return lzma.LZMAFile(f, 'wb', preset=level)
+    return contextlib.nullcontext(f)
+
+
+def open_notebook(filename):
+    """Open a notebook file for reading as text, compressed or not."""
+    with open(filename, 'rb') as f:
+        magic = f.read(len(XZ_MAGIC))
+    if magic.startswith(GZIP_MAGIC):
+        return gzip.open(filename, 'rt', encoding='utf-8')
+    if magic == XZ_MAGIC:
+        return lzma.open(filename, 'rt', encoding='utf-8')
+    return open(filename, 'r', encoding='utf-8')
+
+
+class HashingWriter(object):
+    """
+    Binary file wrapper that keeps the sha256 digest and the size of the
+    bytes written through it.
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.size = 0
+        self.digest = hashlib.sha256()
+
+    def write(self, data):
+        self.digest.update(data)
+        self.size += len(data)
+        return self.f.write(data)
+
+    def flush(self):
+        self.f.flush()
+
+    def hexdigest(self):
+        return self.digest.hexdigest()
@@ -11,30 +11,88 @@
 from enum import Enum
 import types
 from nbformat import v4 as ipynb
+from nbformat import NotebookNode
 
-import sys
 import os
+import hashlib
 import os.path
+import posixpath
 import time
 import re
 from urllib.parse import urlparse
 
-try:   # check for the Python Imaging Library
-    import PIL.Image as Image
-except ImportError:
-    try:   # sometimes PIL modules are put in PYTHONPATH's root
-        import Image
-    except ImportError:
-        Image = None
-
 from docutils import nodes, writers, languages
 
 from sphinx.locale import admonitionlabels, _
 
+from ..builders.validation import validation_error
+from .buffer import CellBuffer
+from .cells import CellBalancer
+from . import formats
+from . import tags
+from . import tables
+
 NL = '\n\n'   # Markdown newline
 
+
+def fenced_text(text):
+    """
+    Return `text` ending with a new line, so that the closing fence after
+    it is on a line of its own.
+    """
+    if text and not text.endswith('\n'):
+        text += '\n'
+    return text
+
+
+SKIP_NODE = object()
+"""Returned by a visitor method to skip the node's children and departure."""
+
 unicode = str
 
+# nbformat 4.5 (nbformat 5.1 and later) gives every cell an id
+CELL_IDS = ipynb.nbformat_minor >= 5
+CELL_ID_LENGTH = 16
+
+
+def make_cell(cell_type, source=''):
+    """
+    Create a notebook cell like ``nbformat.v4.new_*_cell`` does, but
+    without validating it; see the ``ipynb_validation`` setting.  The cell
+    gets its id from `set_cell_ids` once it is finished.
+    """
+    cell = NotebookNode(cell_type=cell_type, source=source,
+                        metadata=NotebookNode())
+    if cell_type == 'code':
+        cell['execution_count'] = None
+        cell['outputs'] = []
+    return cell
+
+
+def cell_id(seed, position, cell):
+    """
+    Return the id of `cell` at `position` in the notebook named by `seed`,
+    a digest of the three and of the cell content.  Unlike the random ids
+    of nbformat, an unchanged cell keeps its id in every build.
+    """
+    data = '%s\0%d\0%s\0%s' % (seed, position, cell['cell_type'],
+                               cell['source'])
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()[:CELL_ID_LENGTH]
+
+
+def set_cell_ids(cells, seed, start=0):
+    """Set the `cell_id` of `cells`, counting positions from `start`."""
+    if CELL_IDS:
+        for position, cell in enumerate(cells, start):
+            cell['id'] = cell_id(seed, position, cell)
+
+
+def make_notebook(metadata):
+    """Create an empty notebook without validating it."""
+    return NotebookNode(nbformat=ipynb.nbformat,
+                        nbformat_minor=ipynb.nbformat_minor,
+                        metadata=NotebookNode(metadata), cells=[])
+
 class DecoMeta(type):
     def __new__(mcs, name, bases, attrs):
         for attr_name, attr_value in attrs.items():
@@ -73,6 +131,18 @@ class IPynbWriter(writers.Writer):
 
     lang_attribute = 'lang'  # name changes to 'xml:lang' in XHTML 1.1
 
+    stream = None
+    """Optional `NotebookStream` that receives the cells as they finish."""
+
+    parts = None
+    """(title, cells) of each part when the document was split."""
+
+    notebook = None
+    """The notebook `output` is the JSON of, unless streamed or split."""
+
+    anchors = None
+    """Number of the part each anchor is in when the document was split."""
+
     def __init__(self, builder):
         writers.Writer.__init__(self)
         self.builder = builder
@@ -80,23 +150,56 @@ class IPynbWriter(writers.Writer):
 
     def translate(self):
         visitor = self.translator_class(self.document, self.builder)
-        self.document.walkabout(visitor)
+        visitor.stream = self.stream
+        visitor.walk(self.document)
         self.output = visitor.astext()
+        self.parts = visitor.parts
+        self.notebook = visitor.notebook
+        self.anchors = visitor.anchors
 
 
 class IPynbTranslator(nodes.GenericNodeVisitor):
 
+    lang_attribute = 'lang'  # name changes to 'xml:lang' in XHTML 1.1
+
     def __init__(self, document, builder):
         nodes.NodeVisitor.__init__(self, document)
         self.settings = settings = document.settings
         lcode = settings.language_code
         self.language = languages.get_language(lcode, document.reporter)
         self.builder = builder
+        # the seed of the cell ids
+        self.docname = getattr(builder, 'current_docname', None) or ''
+        self.cells_written = 0
 
+        self.profile = builder.profile
         self.head = []
-        self.body = []
+        self.body = self.new_buffer()
         self.foot = []
-        self.cells = [ipynb.new_markdown_cell()]
+        self.cells = [make_cell('markdown')]
+        self.stream = None
+        self.recording = []
+        self.parts = []
+        self.notebook = None
+        self.anchors = {}
+        self.part_size = 0
+        config = builder.config   # values from -D are strings
+        self.split_level = int(config.ipynb_split_level or 0)
+        self.split_bytes = int(config.ipynb_split_bytes or 0)
+        self.split_cells = int(config.ipynb_split_cells or 0)
+        self.splitting = bool(self.split_level or self.split_bytes or
+                              self.split_cells)
+        min_size = int(config.ipynb_cell_min_size or 0)
+        max_size = int(config.ipynb_cell_max_size or 0)
+        if min_size or max_size:
+            self.balancer = CellBalancer(min_size, max_size, make_cell)
+        else:
+            self.balancer = None
+        self.table_csv_rows = int(config.ipynb_table_csv_rows or 0)
+        self.part_start = None
+        self.validate = builder.config.ipynb_validation == 'inline'
+        self.fast_dispatch = False
+        self._dispatch = {}
         self.in_document_title = 0
 
         self.section_level = 0
@@ -127,20 +230,128 @@ class IPynbTranslator(nodes.GenericNodeVisitor):
             'superscript': ('<sup>', '</sup>'),
         }
 
+    # Traversal
+
+    def walk(self, node):
+        """
+        Traverse `node` like ``node.walkabout(self)``, but dispatch through
+        a table of the visit/depart methods per node class, built on first
+        use, and let visitor methods skip a node by returning `SKIP_NODE`
+        instead of raising `nodes.SkipNode`.
+        """
+        self.fast_dispatch = True
+        try:
+            self._walk(node)
+        finally:
+            self.fast_dispatch = False
+
+    def _handlers(self, cls):
+        name = cls.__name__
+        handlers = []
+        for prefix, generic, unknown in (
+                ('visit_', self.default_visit, self.unknown_visit),
+                ('depart_', self.default_departure,
+                 self.unknown_departure)):
+            method = getattr(type(self), prefix + name, None)
+            if method is None:
+                handlers.append(unknown)
+            elif method is getattr(nodes.GenericNodeVisitor, prefix + name,
+                                   None):
+                # docutils' generated methods drop what default_visit
+                # returns, SKIP_NODE included
+                handlers.append(generic)
+            else:
+                handlers.append(getattr(self, prefix + name))
+        handlers = tuple(handlers)
+        if self.profile is not None:
+            handlers = self.profile.wrap(name, *handlers)
+        self._dispatch[cls] = handlers
+        return handlers
+
+    def _walk(self, node):
+        # Mirrors nodes.Node.walkabout, exceptions included.
+        try:
+            visit, depart = self._dispatch[node.__class__]
+        except KeyError:
+            visit, depart = self._handlers(node.__class__)
+        call_depart = True
+        stop = False
+        try:
+            try:
+                if visit(node) is SKIP_NODE:
+                    return stop
+            except nodes.SkipNode:
+                return stop
+            except nodes.SkipDeparture:
+                call_depart = False
+            try:
+                for child in node.children[:]:
+                    if self._walk(child):
+                        stop = True
+                        break
+            except nodes.SkipSiblings:
+                pass
+        except nodes.SkipChildren:
+            pass
+        except nodes.StopTraversal:
+            stop = True
+        if call_depart:
+            depart(node)
+        return stop
+
+    def skip_node(self):
+        """
+        Skip the children and departure of the node being visited; use as
+        ``return self.skip_node()``.  Under docutils' own ``walkabout`` this
+        raises `nodes.SkipNode`.
+        """
+        if not self.fast_dispatch:
+            raise nodes.SkipNode
+        return SKIP_NODE
+
     # Utility methods
 
     def astext(self):
-        """Return the final formatted document as a string."""
+        """
+        Return the final formatted document as a string.  When streaming,
+        finish the stream instead and return an empty string.
+        """
 
         authors = self.builder.config.ipynb_author or []
         title = self._docinfo.get('title', '')
         metadata = self.builder.metadata
 
-        nb = ipynb.new_notebook()
-        nb["metadata"].update(metadata)
-        nb["cells"] = self.cells
+        if self.parts:
+            self.parts.append((self.part_title(), self.cells))
+            if self.balancer is not None:
+                self.parts = [(title, self.balancer.balance(cells))
+                              for title, cells in self.parts]
+            return ''
+        nb = make_notebook(metadata)
+        if self.stream is not None:
+            if self.balancer is not None:
+                for cell in self.balancer.close():
+                    self.write_cell(cell)
+            self.check(nb)
+            self.stream.close(nb)
+            return ''
+        if self.balancer is not None:
+            nb["cells"] = self.balancer.balance(self.cells)
+        else:
+            nb["cells"] = self.cells
+        set_cell_ids(nb["cells"], self.docname)
+        self.check(nb)
+        self.notebook = nb
+
+        return formats.writes(nb, self.builder.config.ipynb_minify_json)
 
-        return ipynb.writes(nb)
+    def check(self, node, ref=None):
+        """Validate a notebook or cell in 'inline' validation mode."""
+        if self.validate:
+            error = validation_error(node, ref)
+            if error:
+                self.document.reporter.warning(
+                    'Invalid notebook: %s' % error)
 
     def deunicode(self, text):
         text = text.replace(u'\xa0', '\\ ')
@@ -149,20 +360,11 @@ class IPynbTranslator(nodes.GenericNodeVisitor):
 
     def encode(self, text):
         """Encode special characters in `text` & return."""
-        # @@@ A codec to do these and all other HTML entities would be nice.
-        text = unicode(text)
-        return text.translate({
-            ord('&'): u'&amp;',
-            ord('<'): u'&lt;',
-            ord('"'): u'&quot;',
-            ord('>'): u'&gt;',
-            ord('@'): u'&#64;', # may thwart some address harvesters
-            # TODO: convert non-breaking space only if needed?
-            0xa0: u'&nbsp;'}) # non-breaking space
+        return tags.encode(text)
 
     def ensure_eol(self):
         """Ensure the last line in body is terminated by new line."""
-        if self.body and self.body[-1] and self.body[-1][-1] != '\n':
+        if self.body.last and self.body.last != '\n':
             self.body.append('\n')
 
     def list_marker(self, node):
@@ -187,71 +389,60 @@ class IPynbTranslator(nodes.GenericNodeVisitor):
 
     def flush(self):
         if self.body:
-            self.cells[-1]['source'] = ''.join(self.body)
-            self.body = []
+            self.cells[-1]['source'] = self.body.getvalue()
+            self.body = self.new_buffer()
+            self.finish_cell()
         else:
             del self.cells[-1]    # no content, remove the cell
 
+    def new_buffer(self):
+        if self.profile is None:
+            return CellBuffer()
+        return self.profile.new_buffer()
+
+    def finish_cell(self):
+        """
+        Hand the last, finished cell to the segments being recorded and,
+        when streaming, write it out.
+        """
+        cell = self.cells[-1]
+        self.part_size += len(cell['source'])
+        for segment in self.recording:
+            segment.append(cell)
+        if self.stream is not None:
+            self.cells.pop()
+            if self.balancer is None:
+                self.write_cell(cell)
+            else:
+                for cell in self.balancer.push(cell):
+                    self.write_cell(cell)
+
+    def write_cell(self, cell):
+        set_cell_ids([cell], self.docname, self.cells_written)
+        self.cells_written += 1
+        self.check(cell, cell['cell_type'] + '_cell')
+        self.stream.write_cell(cell)
+
     def new_cell(self, cell_type):
         self.flush()
 
-        if cell_type == "code":
-            cell = ipynb.new_code_cell()
-        elif cell_type == "markdown":
-            cell = ipynb.new_markdown_cell()
-        else:
+        if cell_type not in ("code", "markdown"):
             raise ValueError("Unknown cell type '%s'" % cell_type)
-        self.cells.append(cell)
+        self.cells.append(make_cell(cell_type))
 
 
-    def attval(self, text, whitespace=re.compile('[\n\r\t\v\f]')):
+    def attval(self, text):
         """Cleanse, HTML encode, and return attribute value text."""
-        return self.encode(whitespace.sub(' ', text))
+        return tags.attval(text)
 
     def starttag(self, node, tagname, suffix='\n', empty=False, **attributes):
         """
         Construct and return a start tag given a node (id & class attributes
-        are extracted), tag name, and optional attributes.
+        are extracted), tag name, and optional attributes.  Rendered tags are
+        memoized, see `sphinxcontrib.writers.tags`.
         """
-        tagname = tagname.lower()
-        prefix = []
-        atts = {name.lower(): value for (name, value) in attributes.items()}
-        classes = []
-        languages = []
-        class_attr = atts.pop('class', [])
-        if isinstance(class_attr, str):
-            class_attr = class_attr.split()
-
-        # unify class arguments and move language specification
-        for cls in node.get('classes', []) + class_attr:
-            if cls.startswith('language-'):
-                languages.append(cls[9:])
-            elif cls.strip() and cls not in classes:
-                classes.append(cls)
-        if languages:
-            # attribute name is 'lang' in XHTML 1.0 but 'xml:lang' in 1.1
-            atts[self.lang_attribute] = languages[0]
-        if classes:
-            atts['class'] = classes
-
-        attlist = sorted(atts.items())
-        parts = [tagname]
-        for name, value in attlist:
-            # value=None was used for boolean attributes without
-            # value, but this isn't supported by XHTML.
-            assert value is not None
-            if isinstance(value, list):
-                values = [unicode(v) for v in value]
-                parts.append('%s="%s"' % (name.lower(),
-                                          self.attval(' '.join(values))))
-            else:
-                parts.append('%s="%s"' % (name.lower(),
-                                          self.attval(unicode(value))))
-        if empty:
-            infix = ' /'
-        else:
-            infix = ''
-        return ''.join(prefix) + '<%s%s>' % (' '.join(parts), infix) + suffix
+        return tags.starttag(node.get('classes', ()), tagname, suffix, empty,
+                             attributes, self.lang_attribute)
 
     def emptytag(self, node, tagname, suffix='\n', **attributes):
         """Construct and return an XML-compatible empty tag."""
@@ -261,13 +452,15 @@ class IPynbTranslator(nodes.GenericNodeVisitor):
     def default_visit(self, node):
         """Override for generic, uniform traversals."""
 
+        if self.profile is not None:
+            self.profile.count_default(node)
         node_type = node.__class__.__name__
         if node_type not in _warned:
             self.document.reporter.warning(
                 'The ' + node_type + ' element is not supported.'
             )
             _warned.add(node_type)
-        raise nodes.SkipNode
+        return self.skip_node()
 
     def default_departure(self, node):
         """Override for generic, uniform traversals."""
@@ -417,7 +610,6 @@ class IPynbTranslator(nodes.GenericNodeVisitor):
     def visit_image(self, node):
         atts = {}
         uri = node['uri']
-        print('uri: "%s"' % uri)
         ext = os.path.splitext(uri)[1].lower()
         if ext == '.*':
             ext = '.svg'  # assume .svg
@@ -427,7 +619,7 @@ class IPynbTranslator(nodes.GenericNodeVisitor):
             atts['data'] = uri
             atts['type'] = self.object_image_types[ext]
         else:
-            atts['src'] = uri
+            atts['src'] = self.image_src(uri)
             atts['alt'] = node.get('alt', uri)
         # image size
         if 'width' in node:
@@ -435,22 +627,20 @@ class IPynbTranslator(nodes.GenericNodeVisitor):
         if 'height' in node:
             atts['height'] = node['height']
         if 'scale' in node:
-            if (Image and not ('width' in node and 'height' in node)
+            if (not ('width' in node and 'height' in node)
                 and self.settings.file_insertion_enabled):
-                imagepath = urlparse(uri).path
-                try:
-                    img = Image.open(
-                            imagepath.encode(sys.getfilesystemencoding()))
-                except (IOError, UnicodeEncodeError):
-                    pass # TODO: warn?
-                else:
-                    self.settings.record_dependencies.add(
-                        imagepath.replace('\\', '/'))
+                # the image sizes are cached under the normalized paths of
+                # env.images
+                imagepath = posixpath.normpath(
+                    urlparse(uri).path.replace('\\', '/'))
+                size = self.builder.image_sizes.get(imagepath)
+                if size is not None:
+                    if self.settings.record_dependencies is not None:
+                        self.settings.record_dependencies.add(imagepath)
                     if 'width' not in atts:
-                        atts['width'] = '%dpx' % img.size[0]
+                        atts['width'] = '%dpx' % size[0]
                     if 'height' not in atts:
-                        atts['height'] = '%dpx' % img.size[1]
-                    del img
+                        atts['height'] = '%dpx' % size[1]
             for att_name in 'width', 'height':
                 if att_name in atts:
                     match = re.match(r'([0-9.]+)(\S*)$', atts[att_name])
@@ -484,6 +674,25 @@ class IPynbTranslator(nodes.GenericNodeVisitor):
         else:
             self.body.append(self.emptytag(node, 'img', suffix, **atts))
 
+    def image_src(self, uri):
+        """
+        Return the src of an image: `uri`, or if images are embedded an
+        attachment of the current cell or a file in the asset directory.
+        """
+        assets = self.builder.image_assets
+        if assets is None or urlparse(uri).scheme:
+            return uri
+        resolved = assets.resolve(urlparse(uri).path)
+        if resolved is None:
+            return uri
+        if resolved[0] == 'attachment':
+            name, bundle = resolved[1:]
+            self.cells[-1].setdefault('attachments', {})[name] = bundle
+            return 'attachment:' + name
+        outname = self.builder.get_outname(self.builder.current_docname)
+        return posixpath.relpath(resolved[1],
+                                 posixpath.dirname(outname) or '.')
+
     def depart_image(self, node):
         # self.body.append(self.context.pop())
         pass
@@ -492,7 +701,40 @@ class IPynbTranslator(nodes.GenericNodeVisitor):
         pass
 
     def visit_start_of_file(self, node):
-        pass
+        self.add_anchor('document-' + node['docname'])
+
+    def visit_toctree(self, node):
+        # Only reached when SingleIPynbBuilder streams the assembly: the
+        # included documents are loaded one by one and walked in place.
+        for subtree, segment in self.builder.iter_included(
+                node, self.section_level):
+            if segment is None:
+                self.walk_node(subtree)
+                continue
+            # with the segment cache every document has cells of its own
+            self.new_cell('markdown')
+            if subtree is None:
+                self.splice(segment)
+            else:
+                self.recording.append(segment)
+                self.walk_node(subtree)
+                self.new_cell('markdown')
+                self.recording.pop()
+        return self.skip_node()
+
+    def walk_node(self, node):
+        if self.fast_dispatch:
+            self._walk(node)
+        else:
+            node.walkabout(self)
+
+    def splice(self, cells):
+        """Insert finished `cells` before the current, empty cell."""
+        current = self.cells.pop()
+        for cell in cells:
+            self.cells.append(cell)
+            self.finish_cell()
+        self.cells.append(current)
 
     def visit_raw(self, node):
         if 'html' in node.get('format', '').split():
@@ -503,7 +745,7 @@ class IPynbTranslator(nodes.GenericNodeVisitor):
             if node['classes']:
                 self.body.append('</%s>' % t)
         # Keep non-HTML raw text out of output:
-        raise nodes.SkipNode
+        return self.skip_node()
 
     def visit_topic(self, node):
         self.body.append(self.starttag(node, 'div', CLASS='topic'))
@@ -525,6 +767,7 @@ class IPynbTranslator(nodes.GenericNodeVisitor):
     def visit_target(self, node):
         if not ('refuri' in node or 'refid' in node
                 or 'refname' in node):
+            self.add_anchors(node)
             self.body.append(self.starttag(node, 'span', '', CLASS='target'))
             self.context.append('</span>')
         else:
@@ -547,37 +790,40 @@ class IPynbTranslator(nodes.GenericNodeVisitor):
                 self.new_cell('code')
                 self.body.append(node.astext())
                 self.new_cell('markdown')
-                raise nodes.SkipNode
+                return self.skip_node()
             elif self.builder.skip_other_lang:
-                raise nodes.SkipNode
+                return self.skip_node()
             else:
                 self.body.append('##### code-block for %s\n\n' % lang)
 
         self.body.append(self.indent() + "``` %s\n" % lang)
-        self.body.append(node.astext())
+        self.body.append(fenced_text(node.astext()))
         self.body.append("```\n")
-        raise nodes.SkipNode
+        return self.skip_node()
 
     def depart_literal_block(self, node):
         pass
 
     def visit_Text(self, node):
         self.body.append(node.astext())
-        raise nodes.SkipNode
+        return self.skip_node()
 
     def visit_comment(self, node):
         self.body.append('<!-- ' + node.astext() + ' -->\n')
-        raise nodes.SkipNode
+        return self.skip_node()
 
     def visit_docinfo_item(self, node, name):
         if name == 'author':
             self._docinfo[name].append(node.astext())
         else:
             self._docinfo[name] = node.astext()
-        raise nodes.SkipNode
+        return self.skip_node()
 
     def visit_document(self, node):
-        pass
+        # the single notebook builder names its assembled document, which
+        # starts with the anchor of the master document
+        if 'docname' in node:
+            self.add_anchor('document-' + node['docname'])
 
     def visit_emphasis(self, node):
         self.body.append(self.defs['emphasis'][0])
@@ -601,6 +847,42 @@ class IPynbTranslator(nodes.GenericNodeVisitor):
 
     def visit_section(self, node):
         self.section_level += 1
+        if self.splitting and self.split_here():
+            self.flush()
+            self.parts.append((self.part_title(), self.cells))
+            self.cells = [make_cell('markdown')]
+            self.part_size = 0
+            self.part_start = node
+        self.add_anchors(node)
+
+    def split_here(self):
+        """
+        Whether the section being visited starts a new notebook: at or
+        above ``ipynb_split_level``, or once the current part is over the
+        byte or cell budget.  Parts are never empty, and a streamed
+        document is never split.
+        """
+        if self.stream is not None:
+            return False
+        if len(self.cells) == 1 and not self.body:
+            return False
+        if self.split_level and self.section_level <= self.split_level:
+            return True
+        if self.split_bytes and \
+                self.part_size + self.body.mark() >= self.split_bytes:
+            return True
+        if self.split_cells and \
+                len(self.cells) - (not self.body) >= self.split_cells:
+            return True
+        return False
+
+    def part_title(self):
+        """Return the title of the part being finished."""
+        start = self.part_start
+        if start is not None and len(start) and \
+                isinstance(start[0], nodes.title):
+            return start[0].astext()
+        return self._docinfo['title'] or self.document.get('title', '')
 
     def depart_section(self, node):
         self.section_level -= 1
@@ -619,8 +901,7 @@ class IPynbTranslator(nodes.GenericNodeVisitor):
 
     def visit_subtitle(self, node):
         if isinstance(node.parent, nodes.document):
-            self.visit_docinfo_item(node, 'subtitle')
-            raise nodes.SkipNode
+            return self.visit_docinfo_item(node, 'subtitle')
 
     def visit_superscript(self, node):
         self.body.append(self.defs['superscript'][0])
@@ -644,26 +925,107 @@ class IPynbTranslator(nodes.GenericNodeVisitor):
                          % (node['type'], node['level'], node['source'], line))
 
     def visit_title(self, node):
+        if isinstance(node.parent, nodes.table):
+            self.body.append('<caption>')
+            return
         self.body.append('\n' + self.section_level * '#' + ' ')
         if self.section_level <= 1 and not self.in_document_title:
-            self.in_document_title = len(self.body)
+            self.in_document_title = self.body.mark()
 
     def depart_title(self, node):
+        if isinstance(node.parent, nodes.table):
+            self.body.append('</caption>\n')
+            return
         self.body.append('\n')
         if self.in_document_title > 0:
-            self._docinfo['title'] = ''.join(self.body[self.in_document_title:-1])
+            self._docinfo['title'] = self.body.text(self.in_document_title,
+                                                    self.body.mark() - 1)
             self.in_document_title = -1
 
     def visit_transition(self, node):
         # Simply replace a transition by a horizontal rule.
         # Could use three or more '*', '_' or '-'.
         self.body.append('\n---\n\n')
-        raise nodes.SkipNode
+        return self.skip_node()
 
     def visit_table(self, node):
-        self.body.append(
-            self.starttag(node, 'table', '', border='1'))
-       # elf.body.append('<table border="1">')
+        grids = self.table_grids(node)
+        if grids is None:
+            # spans or block content: HTML
+            self.body.append(
+                self.starttag(node, 'table', '', border='1'))
+            return
+        self.add_anchors(node)
+        for child in node.children:
+            if isinstance(child, nodes.title):
+                self.ensure_eol()
+                self.body.append('\n%s**%s**\n' % (self.indent(),
+                                                   self.render_inline(child)))
+        for header, rows, ncols in grids:
+            if self.table_csv_rows and len(rows) > self.table_csv_rows \
+                    and self.builder.kernel == 'python':
+                self.csv_table(header, rows)
+            else:
+                self.pipe_table(header, rows, ncols)
+        return self.skip_node()
+
+    def table_grids(self, node):
+        """
+        Return the `tables.grid` of every group of the table `node`, or
+        None if one of them is not a plain grid.
+        """
+        grids = [tables.grid(child) for child in node.children
+                 if isinstance(child, nodes.tgroup)]
+        if not grids or None in grids:
+            return None
+        return grids
+
+    def render_inline(self, node):
+        """Return the Markdown of the children of `node`, rendered apart."""
+        body, self.body = self.body, self.new_buffer()
+        try:
+            for child in node.children:
+                self.walk_node(child)
+            return self.body.getvalue()
+        finally:
+            self.body = body
+
+    def entry_text(self, entry):
+        """Return the content of a table entry as one line of Markdown."""
+        text = tables.plain_text(entry)
+        if text is not None:
+            return tables.cell_text([text])
+        return tables.cell_text([self.render_inline(paragraph)
+                                 for paragraph in entry.children])
+
+    def pipe_table(self, header, rows, ncols):
+        table = tables.pipe_table(
+            [self.entry_text(entry) for entry in header[0]] if header
+            else None,
+            [[self.entry_text(entry) for entry in row] for row in rows],
+            ncols)
+        indent = self.indent()
+        self.ensure_eol()
+        self.body.append('\n')
+        self.body.append(''.join(indent + line if line != '\n' else line
+                                 for line in table.splitlines(True))
+                         if indent else table)
+
+    def csv_table(self, header, rows):
+        """
+        Put the table in a code cell as CSV data, with its source hidden,
+        so it is only loaded when the cell runs.
+        """
+        data = tables.csv_text(
+            [entry.astext() for entry in header[0]] if header else None,
+            [[entry.astext() for entry in row] for row in rows])
+        self.ensure_eol()
+        self.body.append('\n%s*Table of %d rows, run the next cell to load '
+                         'it.*\n' % (self.indent(), len(rows)))
+        self.new_cell('code')
+        self.cells[-1]['metadata']['jupyter'] = {'source_hidden': True}
+        self.body.append(tables.csv_source(data, bool(header)))
+        self.new_cell('markdown')
 
     def depart_table(self, node):
         self.body.append('</table>\n')
@@ -698,7 +1060,6 @@ class IPynbTranslator(nodes.GenericNodeVisitor):
             tagname = 'td'
         node.parent.column += 1
 
-        self.body.append('<%s ' % tagname)
         if 'morerows' in node:
             atts['rowspan'] = '%d' % (node['morerows'] + 1)
 
@@ -707,7 +1068,7 @@ class IPynbTranslator(nodes.GenericNodeVisitor):
             node.parent.column += node['morecols']
 
         self.body.append(
-            self.starttag(node, tagname, '', atts))
+            self.starttag(node, tagname, '', **atts))
 
         self.context.append('</%s>\n' % tagname)
         if len(node) == 0:              # empty cell
@@ -724,7 +1085,7 @@ class IPynbTranslator(nodes.GenericNodeVisitor):
         self.body.append('</tbody>\n')
 
     def visit_colspec(self, node):
-        raise nodes.SkipNode
+        return self.skip_node()
 
     def depart_colspec(self, node):
         pass
@@ -805,10 +1166,34 @@ class IPynbTranslator(nodes.GenericNodeVisitor):
         self.body.append('*')
 
     def visit_reference(self, node):
-        pass
+        if 'refuri' in node:
+            uri = node['refuri']
+            if node.get('internal'):
+                uri = self.builder.resolve_uri(uri)
+        elif 'refid' in node:
+            uri = '#' + node['refid']
+        else:
+            self.context.append('')
+            return
+        self.body.append('[')
+        self.context.append('](%s)' % uri.replace(' ', '%20')
+                                         .replace('(', '%28')
+                                         .replace(')', '%29'))
 
     def depart_reference(self, node):
-        pass
+        suffix = self.context.pop()
+        if suffix:
+            self.body.append(suffix)
+
+    def add_anchor(self, id):
+        """Add an HTML anchor, the target of links to ``#id``."""
+        self.body.append('<a id="%s"></a>' % id)
+        if self.splitting:
+            self.anchors[id] = len(self.parts)
+
+    def add_anchors(self, node):
+        for id in node.get('ids', ()):
+            self.add_anchor(id)
 
     def visit_block_quote(self, node):
         self.body.append(self.indent())
@@ -818,10 +1203,10 @@ class IPynbTranslator(nodes.GenericNodeVisitor):
 
     def visit_doctest_block(self, node):
         self.body.append(self.indent() + '``` python\n')
-        self.body.append(node.astext().replace('<BLANKLINE>\n',
-                                               '\n'))
+        self.body.append(fenced_text(node.astext().replace('<BLANKLINE>\n',
+                                                           '\n')))
         self.body.append('```\n')
-        raise nodes.SkipNode
+        return self.skip_node()
 
     def depart_doctest_block(self, node):
         pass
@@ -832,19 +1217,26 @@ class IPynbTranslator(nodes.GenericNodeVisitor):
     def depart_inline(self, node):
         pass
 
+    def latex(self, node):
+        # Sphinx < 1.8 math nodes carry the LaTeX in an attribute, the
+        # docutils nodes used since as text
+        if 'latex' in node:
+            return node['latex']
+        return node.astext()
+
     def visit_math(self, node):
-        self.body.append('$' + node['latex'] + '$')
-        raise nodes.SkipNode
+        self.body.append('$' + self.latex(node) + '$')
+        return self.skip_node()
 
     def visit_math_block(self, node):
         self.body.append('\n' + self.indent() +
-                         '$$' + node['latex'] + '$$\n')
-        raise nodes.SkipNode
+                         '$$' + self.latex(node) + '$$\n')
+        return self.skip_node()
 
     def visit_displaymath(self, node):
         self.body.append('\n' + self.indent() +
-                         '$$' + node['latex'] + '$$\n')
-        raise nodes.SkipNode
+                         '$$' + self.latex(node) + '$$\n')
+        return self.skip_node()
 
 # TODO Eventually we should silently ignore unsupported reStructuredText
 #      constructs and document somewhere that they are not supported.
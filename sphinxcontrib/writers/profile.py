@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+    sphinxcontrib.writers.profile
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Per node type profiling of the Jupyter Notebook translator.
+
+    When profiling is enabled the translator wraps every handler it puts
+    in its dispatch table, so call counts, cumulative time and the number
+    of characters each handler appends are recorded per ``visit_`` and
+    ``depart_`` method, along with the node types that fall through to
+    ``default_visit``.  When it is disabled the dispatch table holds the
+    plain methods and nothing is measured.
+
+    :copyright: Copyright 2016 by Ad Thiers.
+    :license: BSD, see LICENSE.txt for details.
+"""
+
+import time
+
+from .buffer import CellBuffer
+
+
+class CountingCellBuffer(CellBuffer):
+    """A `CellBuffer` that adds the length of its text to a profile."""
+
+    __slots__ = ('profile',)
+
+    def __init__(self, profile):
+        CellBuffer.__init__(self)
+        self.profile = profile
+
+    def append(self, text):
+        self.profile.chars += len(text)
+        CellBuffer.append(self, text)
+
+
+class VisitorProfile(object):
+    """
+    Statistics of one build, or of the part of it done in one process.
+
+    ``handlers`` maps a handler name to ``[calls, seconds, chars]``,
+    ``default_visits`` a node class name to the number of nodes handled by
+    ``default_visit``, and ``documents`` a docname to ``[nodes, seconds,
+    bytes]``, where bytes is the size of the notebook written.
+    """
+
+    def __init__(self):
+        self.handlers = {}
+        self.default_visits = {}
+        self.documents = {}
+        self.nodes = 0
+        self.chars = 0
+
+    def new_buffer(self):
+        return CountingCellBuffer(self)
+
+    def wrap(self, name, visit, depart):
+        """Return timed versions of the `visit` and `depart` handlers."""
+        return (self._timed('visit_' + name, visit, True),
+                self._timed('depart_' + name, depart, False))
+
+    def _timed(self, key, handler, is_visit):
+        stats = self.handlers.setdefault(key, [0, 0.0, 0])
+        clock = time.perf_counter
+
+        def timed(node):
+            if is_visit:
+                self.nodes += 1
+            chars = self.chars
+            start = clock()
+            try:
+                return handler(node)
+            finally:
+                stats[0] += 1
+                stats[1] += clock() - start
+                stats[2] += self.chars - chars
+        return timed
+
+    def count_default(self, node):
+        name = node.__class__.__name__
+        self.default_visits[name] = self.default_visits.get(name, 0) + 1
+
+    def add_document(self, docname, nodes, seconds, size):
+        self.documents[docname] = [nodes, seconds, size]
+
+    def data(self):
+        return {'handlers': self.handlers,
+                'default_visits': self.default_visits,
+                'documents': self.documents}
+
+    def merge(self, data):
+        """Add the statistics `data` of another process."""
+        for key, (calls, seconds, chars) in data['handlers'].items():
+            stats = self.handlers.setdefault(key, [0, 0.0, 0])
+            stats[0] += calls
+            stats[1] += seconds
+            stats[2] += chars
+        for name, count in data['default_visits'].items():
+            self.default_visits[name] = \
+                self.default_visits.get(name, 0) + count
+        self.documents.update(data['documents'])
+
+    def as_json(self):
+        """Return the statistics, most expensive first, for dumping."""
+        return {
+            'handlers': [
+                {'handler': key, 'calls': calls, 'seconds': seconds,
+                 'chars': chars}
+                for key, (calls, seconds, chars) in sorted(
+                    self.handlers.items(), key=lambda item: (-item[1][1],
+                                                             item[0]))
+                if calls],
+            'default_visits': self.default_visits,
+            'documents': [
+                {'docname': docname, 'nodes': nodes, 'seconds': seconds,
+                 'bytes': size}
+                for docname, (nodes, seconds, size) in sorted(
+                    self.documents.items(), key=lambda item: (-item[1][1],
+                                                              item[0]))],
+        }
+
+    def report(self, limit=20):
+        """Return the lines of a report of the `limit` costliest entries."""
+        data = self.as_json()
+        lines = ['%-32s %9s %10s %12s' % ('handler', 'calls', 'seconds',
+                                          'chars')]
+        for entry in data['handlers'][:limit]:
+            lines.append('%-32s %9d %10.4f %12d' %
+                         (entry['handler'], entry['calls'], entry['seconds'],
+                          entry['chars']))
+        lines.append('%-32s %9s %10s %12s' % ('document', 'nodes', 'seconds',
+                                              'bytes'))
+        for entry in data['documents'][:limit]:
+            lines.append('%-32s %9d %10.4f %12d' %
+                         (entry['docname'], entry['nodes'], entry['seconds'],
+                          entry['bytes']))
+        if self.default_visits:
+            lines.append('default_visit: ' + ', '.join(
+                '%s (%d)' % item for item in sorted(
+                    self.default_visits.items(),
+                    key=lambda item: (-item[1], item[0]))))
+        return lines
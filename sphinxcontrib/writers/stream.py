@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+    sphinxcontrib.writers.stream
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Streaming serializer for Jupyter Notebooks.
+
+    Cells are written to the output file as soon as the translator has
+    finished them, so memory stays bounded by the largest cell instead of
+    the whole notebook.  The bytes written are identical to those of
+    ``nbformat.v4.writes``, or of ``formats.writes`` for minified JSON.
+
+    :copyright: Copyright 2016 by Ad Thiers.
+    :license: BSD, see LICENSE.txt for details.
+"""
+
+import copy
+import json
+import hashlib
+
+import nbformat
+from nbformat.v4.nbjson import BytesEncoder
+from nbformat.v4.rwbase import split_lines, strip_transient
+
+from .formats import MINIFIED_OPTIONS
+
+# The same settings as nbformat.v4.nbjson.JSONWriter
+JSON_OPTIONS = {
+    'cls': BytesEncoder,
+    'indent': 1,
+    'sort_keys': True,
+    'separators': (',', ': '),
+    'ensure_ascii': False,
+}
+
+# sort_keys puts "cells" first, so everything before the first cell is fixed
+HEAD = '{\n "cells": ['
+MINIFIED_HEAD = '{"cells":['
+
+
+class NotebookStream(object):
+    """
+    Write a notebook to the binary file `f` one cell at a time, as
+    indented JSON or, with `minify`, as minified JSON.
+
+    Call :meth:`write_cell` for every finished cell and :meth:`close` with
+    the notebook at the end.  The sha256 digest and the size of everything
+    written are available afterwards.
+    """
+
+    def __init__(self, f, minify=False):
+        self.f = f
+        self.minify = minify
+        self.ncells = 0
+        self.size = 0
+        self.digest = hashlib.sha256()
+
+    def _write(self, text):
+        data = text.encode('utf-8')
+        self.f.write(data)
+        self.digest.update(data)
+        self.size += len(data)
+
+    def write_cell(self, cell):
+        if self.minify:
+            text = json.dumps(cell, **MINIFIED_OPTIONS)
+            self._write((',' if self.ncells else MINIFIED_HEAD) + text)
+            self.ncells += 1
+            return
+        nb = split_lines(nbformat.from_dict({'cells': [copy.deepcopy(cell)]}))
+        text = json.dumps(nb.cells[0], **JSON_OPTIONS)
+        self._write((',\n' if self.ncells else HEAD + '\n') +
+                    '\n'.join('  ' + line for line in text.split('\n')))
+        self.ncells += 1
+
+    def close(self, nb):
+        """
+        Finish the notebook.  The cells of `nb` are ignored; its metadata
+        and format version follow the cells already written.
+        """
+        nb = nbformat.from_dict(dict((key, value) for key, value in nb.items()
+                                     if key != 'cells'))
+        nb['cells'] = []
+        if self.minify:
+            text = json.dumps(strip_transient(nb), **MINIFIED_OPTIONS)
+            self._write(('' if self.ncells else MINIFIED_HEAD) +
+                        text[len(MINIFIED_HEAD):])
+            return
+        text = json.dumps(strip_transient(nb), **JSON_OPTIONS)
+        assert text.startswith(HEAD)
+        self._write(('\n ' if self.ncells else HEAD) + text[len(HEAD):])
+
+    def hexdigest(self):
+        return self.digest.hexdigest()
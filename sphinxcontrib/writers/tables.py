@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+    sphinxcontrib.writers.tables
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Table engine of the Jupyter Notebook translator.
+
+    A table whose groups are plain grids, without row or column spans and
+    with nothing but paragraphs in its entries, is rendered a whole group
+    at a time: as a Markdown pipe table, or, above a number of rows, as
+    CSV data in a code cell that loads it when run.  Other tables are left
+    to the HTML handlers of the translator.
+
+    :copyright: Copyright 2016 by Ad Thiers.
+    :license: BSD, see LICENSE.txt for details.
+"""
+
+import io
+import csv
+
+from docutils import nodes
+
+CSV_SOURCE = '''\
+import csv, io
+data = %s
+try:
+    import pandas
+    table = pandas.read_csv(io.StringIO(data)%s)
+except ImportError:
+    table = list(csv.reader(io.StringIO(data)))
+table'''
+
+
+def grid(tgroup):
+    """
+    Return the ``(header, rows, ncols)`` of `tgroup`, where `header` and
+    `rows` are lists of lists of entries, or None if it is not a plain grid
+    with at most one header row.
+    """
+    header = []
+    rows = []
+    for child in tgroup.children:
+        if isinstance(child, nodes.thead):
+            header.extend(child.children)
+        elif isinstance(child, nodes.tbody):
+            rows.extend(child.children)
+    if len(header) > 1:
+        return None
+    ncols = tgroup.get('cols') or \
+        sum(1 for child in tgroup.children
+            if isinstance(child, nodes.colspec))
+    result = []
+    for row in header + rows:
+        entries = row.children
+        if len(entries) != ncols:
+            return None
+        for entry in entries:
+            if 'morerows' in entry or 'morecols' in entry:
+                return None
+            for child in entry.children:
+                if not isinstance(child, nodes.paragraph):
+                    return None
+        result.append(entries)
+    return result[:len(header)], result[len(header):], ncols
+
+
+def plain_text(entry):
+    """
+    Return the text of `entry` if it is plain text in at most one
+    paragraph, else None.
+    """
+    if not entry.children:
+        return ''
+    if len(entry.children) > 1:
+        return None
+    for child in entry.children[0].children:
+        if not isinstance(child, nodes.Text):
+            return None
+    return entry.astext()
+
+
+def cell_text(paragraphs):
+    """
+    Join the Markdown of the paragraphs of an entry into one line of a
+    pipe table.
+    """
+    lines = []
+    for paragraph in paragraphs:
+        text = ' '.join(line.strip() for line in paragraph.splitlines())
+        if text:
+            lines.append(text.replace('|', '\\|'))
+    return '<br>'.join(lines)
+
+
+def pipe_table(header, rows, ncols):
+    """
+    Return the Markdown pipe table of the `header` row (an empty one if
+    None) and the `rows` of `ncols` cell texts.  The table ends with an
+    empty line: any line right after it would be read as one more row.
+    """
+    out = ['| %s |\n' % ' | '.join(header or [''] * ncols),
+           '|%s\n' % ('---|' * ncols)]
+    for row in rows:
+        out.append('| %s |\n' % ' | '.join(row))
+    out.append('\n')
+    return ''.join(out)
+
+
+def csv_text(header, rows):
+    """Return the CSV of the `header` row (if not None) and the `rows`."""
+    f = io.StringIO()
+    writer = csv.writer(f, lineterminator='\n')
+    if header is not None:
+        writer.writerow(header)
+    writer.writerows(rows)
+    return f.getvalue()
+
+
+def csv_source(data, header=True):
+    """
+    Return the code that loads the CSV `data`, which starts with a header
+    row if `header` is true, as a table.
+    """
+    if "'''" in data or data.endswith('\\'):
+        literal = repr(data)
+    else:
+        literal = "r'''%s'''" % data
+    return CSV_SOURCE % (literal, '' if header else ', header=None')
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+    sphinxcontrib.writers.tags
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    HTML tag rendering for the Jupyter Notebook translator.
+
+    Tables, field lists and definition lists render the same start tags
+    over and over.  Rendered tags are memoized by tag name, classes and
+    attributes in a bounded LRU cache, and escaping is skipped for text
+    without special characters.
+
+    :copyright: Copyright 2016 by Ad Thiers.
+    :license: BSD, see LICENSE.txt for details.
+"""
+
+import re
+from functools import lru_cache
+
+TAG_CACHE_SIZE = 4096
+"""Maximum number of distinct start tags kept."""
+
+ESCAPES = {
+    ord('&'): u'&amp;',
+    ord('<'): u'&lt;',
+    ord('"'): u'&quot;',
+    ord('>'): u'&gt;',
+    ord('@'): u'&#64;',  # may thwart some address harvesters
+    # TODO: convert non-breaking space only if needed?
+    0xa0: u'&nbsp;',     # non-breaking space
+}
+SPECIAL = re.compile(u'[&<">@\xa0]')
+WHITESPACE = re.compile('[\n\r\t\v\f]')
+
+
+def encode(text):
+    """Encode special characters in `text` & return."""
+    text = str(text)
+    if SPECIAL.search(text) is None:
+        return text
+    return text.translate(ESCAPES)
+
+
+@lru_cache(maxsize=TAG_CACHE_SIZE)
+def attval(text):
+    """Cleanse, HTML encode, and return attribute value text."""
+    return encode(WHITESPACE.sub(' ', text))
+
+
+def render_starttag(tagname, classes, attributes, suffix, empty,
+                    lang_attribute):
+    """
+    Render a start tag.  `classes` are the node's classes, `attributes` a
+    sequence of (name, value) pairs; list values are given as tuples.
+    """
+    tagname = tagname.lower()
+    atts = {name.lower(): value for (name, value) in attributes}
+    merged = []
+    languages = []
+    class_attr = atts.pop('class', [])
+    if isinstance(class_attr, str):
+        class_attr = class_attr.split()
+
+    # unify class arguments and move language specification
+    for cls in list(classes) + list(class_attr):
+        if cls.startswith('language-'):
+            languages.append(cls[9:])
+        elif cls.strip() and cls not in merged:
+            merged.append(cls)
+    if languages:
+        # attribute name is 'lang' in XHTML 1.0 but 'xml:lang' in 1.1
+        atts[lang_attribute] = languages[0]
+    if merged:
+        atts['class'] = merged
+
+    parts = [tagname]
+    for name, value in sorted(atts.items()):
+        # value=None was used for boolean attributes without
+        # value, but this isn't supported by XHTML.
+        assert value is not None
+        if isinstance(value, (list, tuple)):
+            values = [str(v) for v in value]
+            parts.append('%s="%s"' % (name, attval(' '.join(values))))
+        else:
+            parts.append('%s="%s"' % (name, attval(str(value))))
+    if empty:
+        infix = ' /'
+    else:
+        infix = ''
+    return '<%s%s>' % (' '.join(parts), infix) + suffix
+
+
+cached_starttag = lru_cache(maxsize=TAG_CACHE_SIZE)(render_starttag)
+
+
+def _normalize(value):
+    # Rendering applies str() to every value anyway; doing it first makes
+    # the value hashable and keeps 1 and 1.0 from sharing a cache entry.
+    if isinstance(value, (list, tuple)):
+        return tuple(str(v) for v in value)
+    if value is None:
+        return None
+    return str(value)
+
+
+def starttag(classes, tagname, suffix, empty, attributes, lang_attribute):
+    """
+    Return the rendered start tag from the cache, rendering it on a miss.
+    `attributes` is a dict of keyword arguments as given to the
+    translator's ``starttag``.
+    """
+    for value in attributes.values():
+        if type(value) is not str:
+            items = tuple((name, _normalize(value))
+                          for name, value in attributes.items())
+            break
+    else:
+        items = tuple(attributes.items())
+    return cached_starttag(tagname, tuple(classes), items, suffix,
+                           bool(empty), lang_attribute)
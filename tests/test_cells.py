@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+    Tests for the cell sizes of the ipynb builder.
+"""
+
+import json
+
+from sphinx.application import Sphinx
+from sphinx.util.docutils import docutils_namespace
+
+from sphinxcontrib.writers import cells
+
+INDEX = '''\
+Cells
+=====
+
+Section A
+---------
+
+%s
+
+::
+
+    x = 1
+
+%s
+
+Section B
+---------
+
+%s
+'''
+
+TEXT = 'Some text to fill the section with. ' * 5
+
+
+def build(tmpdir, source, **overrides):
+    srcdir = tmpdir.mkdir('src')
+    srcdir.join('conf.py').write("extensions = ['sphinxcontrib.nbbuilder']\n"
+                                 "master_doc = 'index'\n")
+    srcdir.join('index.rst').write(source)
+    outdir = tmpdir.join('out')
+    with docutils_namespace():
+        app = Sphinx(str(srcdir), str(srcdir), str(outdir),
+                     str(tmpdir.join('doctrees')), 'ipynb', overrides,
+                     status=None, warning=None, freshenv=True)
+        app.build()
+    with open(str(outdir.join('index.ipynb'))) as f:
+        return json.load(f)
+
+
+def test_boundaries_after_fence_closed_at_end_of_line():
+    text = '``` python\nx = 1```\n\nText.\n\n## Heading\n'
+    assert list(cells.boundaries(text)) == [(21, False), (28, True)]
+
+
+def test_boundaries_before_anchored_heading():
+    text = 'Text.\n\n<a id="b"></a><a id="id1"></a>\n## B\n'
+    assert list(cells.boundaries(text)) == [(7, True)]
+
+
+def test_code_block_followed_by_heading(tmpdir):
+    nb = build(tmpdir, INDEX % (TEXT, TEXT, TEXT),
+               ipynb_cell_max_size=400)
+    sources = [''.join(cell['source']) for cell in nb['cells']
+               if cell['cell_type'] == 'markdown']
+    assert 'x = 1\n```\n' in ''.join(sources)
+    assert max(len(source) for source in sources) <= 400
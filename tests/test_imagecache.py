@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""
+    Tests for the image size cache of the ipynb builders.
+"""
+
+import zlib
+import struct
+
+from sphinxcontrib.builders.imagecache import ImageSizeCache
+
+
+def write_png(filename, width, height):
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    chunk = b'IHDR' + header
+    with open(filename, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n' + struct.pack('>I', len(header)) +
+                chunk + struct.pack('>I', zlib.crc32(chunk) & 0xffffffff))
+
+
+def test_probed_entries_merge_into_main_cache(tmpdir):
+    write_png(str(tmpdir.join('img.png')), 120, 80)
+    cachefile = str(tmpdir.join('cache.json'))
+    main = ImageSizeCache(cachefile, str(tmpdir))
+    worker = ImageSizeCache(cachefile, str(tmpdir))
+    worker.get('img.png')
+    probed = worker.probed()
+    assert list(probed) == ['img.png']
+    assert worker.probed() == {}
+    main.merge(probed)
+    assert main.entries == worker.entries
+    assert main.dirty
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+    Tests that the extension stays cheap to load for other builders.
+"""
+
+import os
+import sys
+import json
+import subprocess
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+EXTENSIONS = ['sphinxcontrib.nbbuilder']
+
+HEAVY = ['sphinxcontrib.builders.nb', 'nbformat', 'PIL']
+
+# a fresh interpreter, so modules loaded by other tests do not count
+BUILD = '''\
+import sys, json
+from sphinx.application import Sphinx
+from sphinx.util.docutils import docutils_namespace
+srcdir, outdir, doctreedir, buildername = sys.argv[1:]
+with docutils_namespace():
+    app = Sphinx(srcdir, srcdir, outdir, doctreedir, buildername,
+                 status=None, warning=None, freshenv=True)
+    app.build()
+print(json.dumps(sorted(sys.modules)))
+'''
+
+
+def loaded_modules(tmpdir, buildername, extension=True):
+    """
+    Return the modules loaded by a `buildername` build of a one page project,
+    which lists this extension if `extension` is true.
+    """
+    project = tmpdir.mkdir('%s-%s' % (buildername, extension))
+    srcdir = project.mkdir('src')
+    srcdir.join('conf.py').write(
+        'extensions = %r\n'
+        "master_doc = 'index'\n" % (EXTENSIONS if extension else []))
+    srcdir.join('index.rst').write('Import\n======\n\nNothing to load.\n')
+    # the checkout, for a run without installing the package
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+        [ROOT] + [p for p in [os.environ.get('PYTHONPATH')] if p]))
+    output = subprocess.check_output(
+        [sys.executable, '-c', BUILD, str(srcdir), str(project.join('out')),
+         str(project.join('doctrees')), buildername],
+        cwd=str(tmpdir), env=env, universal_newlines=True)
+    return set(json.loads(output.splitlines()[-1]))
+
+
+@pytest.mark.parametrize('buildername', ['html', 'linkcheck'])
+def test_other_builders_skip_heavy_imports(tmpdir, buildername):
+    # Sphinx itself may load PIL for the image sizes of these builders
+    own = loaded_modules(tmpdir, buildername, False)
+    modules = loaded_modules(tmpdir, buildername) - own
+    assert [name for name in HEAVY if name in modules] == []
+
+
+def test_ipynb_builder_imports_writer(tmpdir):
+    modules = loaded_modules(tmpdir, 'ipynb')
+    assert 'sphinxcontrib.builders.nb' in modules
+    assert 'nbformat' in modules
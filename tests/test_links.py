@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+    Tests for links into documents split into several notebooks.
+"""
+
+import os
+import re
+import json
+
+from sphinx.application import Sphinx
+from sphinx.util.docutils import docutils_namespace
+
+INDEX = '''\
+Index
+=====
+
+.. toctree::
+
+   other
+   ref
+'''
+
+OTHER = '''\
+Other
+=====
+
+.. _first:
+
+First
+-----
+
+One.
+%s
+.. _deep:
+
+Deep
+----
+
+Two.
+'''
+
+INSERTED = '''
+Inserted
+--------
+
+New.
+'''
+
+REF = '''\
+Ref
+===
+
+See :ref:`deep`.
+'''
+
+LINK = re.compile(r'\]\((other[^)]*)\)')
+
+
+def build(tmpdir):
+    srcdir = tmpdir.join('src')
+    outdir = tmpdir.join('out')
+    with docutils_namespace():
+        app = Sphinx(str(srcdir), str(srcdir), str(outdir),
+                     str(tmpdir.join('doctrees')), 'ipynb',
+                     status=None, warning=None)
+        app.build()
+    with open(str(outdir.join('ref.ipynb'))) as f:
+        nb = json.load(f)
+    return [link for cell in nb['cells']
+            for link in LINK.findall(''.join(cell['source']))]
+
+
+def write_sources(tmpdir, inserted=''):
+    srcdir = tmpdir.ensure('src', dir=True)
+    srcdir.join('conf.py').write("extensions = ['sphinxcontrib.nbbuilder']\n"
+                                 "master_doc = 'index'\n"
+                                 "ipynb_split_level = 2\n")
+    srcdir.join('index.rst').write(INDEX)
+    srcdir.join('ref.rst').write(REF)
+    other = srcdir.join('other.rst')
+    mtime = other.mtime() if other.check() else None
+    other.write(OTHER % inserted)
+    if mtime is not None:
+        # newer than the last read, whatever the timestamp granularity
+        os.utime(str(other), (mtime + 10, mtime + 10))
+
+
+def test_link_to_part_of_fresh_build(tmpdir):
+    write_sources(tmpdir)
+    assert build(tmpdir) == ['other-3.ipynb#deep']
+
+
+def test_link_follows_moved_anchor(tmpdir):
+    write_sources(tmpdir)
+    build(tmpdir)
+    # only other.rst changes, ref.rst is written again for its link
+    write_sources(tmpdir, INSERTED)
+    assert build(tmpdir) == ['other-4.ipynb#deep']
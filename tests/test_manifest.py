@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+"""
+    Tests for the build manifest of the ipynb builder.
+"""
+
+import json
+
+from sphinx.application import Sphinx
+from sphinx.util.docutils import docutils_namespace
+
+
+def build(tmpdir):
+    srcdir = tmpdir.ensure('src', dir=True)
+    outdir = tmpdir.join('out')
+    with docutils_namespace():
+        app = Sphinx(str(srcdir), str(srcdir), str(outdir),
+                     str(tmpdir.join('doctrees')), 'ipynb',
+                     status=None, warning=None)
+        app.build()
+    with open(str(outdir.join('ipynb-manifest.json'))) as f:
+        return dict((entry['path'], entry['status'])
+                    for entry in json.load(f)['files'])
+
+
+def test_no_op_build_marks_all_unchanged(tmpdir):
+    srcdir = tmpdir.mkdir('src')
+    srcdir.join('conf.py').write("extensions = ['sphinxcontrib.nbbuilder']\n"
+                                 "master_doc = 'index'\n")
+    srcdir.join('index.rst').write('Index\n=====\n\nText.\n')
+    assert build(tmpdir) == {'index.ipynb': 'changed'}
+    # nothing is out of date, Sphinx stops before writing
+    assert build(tmpdir) == {'index.ipynb': 'unchanged'}
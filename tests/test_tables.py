@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+    Tests for the Markdown tables of the ipynb builder.
+"""
+
+import json
+
+from sphinx.application import Sphinx
+from sphinx.util.docutils import docutils_namespace
+
+from sphinxcontrib.writers import tables
+
+INDEX = '''\
+Tables
+======
+
+=====  =====
+A      B
+=====  =====
+1      2
+3      4
+=====  =====
+
+.. _after:
+
+After
+-----
+
+See :ref:`after`.
+'''
+
+
+def build(tmpdir, source):
+    srcdir = tmpdir.mkdir('src')
+    srcdir.join('conf.py').write("extensions = ['sphinxcontrib.nbbuilder']\n"
+                                 "master_doc = 'index'\n")
+    srcdir.join('index.rst').write(source)
+    outdir = tmpdir.join('out')
+    with docutils_namespace():
+        app = Sphinx(str(srcdir), str(srcdir), str(outdir),
+                     str(tmpdir.join('doctrees')), 'ipynb',
+                     status=None, warning=None, freshenv=True)
+        app.build()
+    with open(str(outdir.join('index.ipynb'))) as f:
+        return json.load(f)
+
+
+def test_pipe_table_ends_with_empty_line():
+    table = tables.pipe_table(['A', 'B'], [['1', '2']], 2)
+    assert table == '| A | B |\n|---|---|\n| 1 | 2 |\n\n'
+
+
+def test_table_followed_by_labelled_section(tmpdir):
+    nb = build(tmpdir, INDEX)
+    source = ''.join(''.join(cell['source']) for cell in nb['cells'])
+    assert '| 3 | 4 |\n\n<a id="after"></a>' in source